@@ -0,0 +1,186 @@
+import argparse
+import calendar
+import configparser
+import datetime
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import psycopg2
+from sql_queries import (
+    backfill_partition_lock, backfill_partition_queries,
+    backfill_staging_events_copy, backfill_staging_events_create,
+    songplay_partition_insert
+)
+
+config = configparser.ConfigParser()
+# Check to see which environment the code is running in.
+if 'Brent' in os.uname().nodename:
+    config.read('/Users/brent/projects/redjam/dwh.cfg')
+else:
+    config.read('/usr/local/projects/redjam/dwh.cfg')
+
+
+HOST = config.get("CLUSTER", "HOST")
+DBNAME = config.get("CLUSTER", "DBNAME")
+USER = config.get("CLUSTER", "USER")
+PASSWORD = config.get("CLUSTER", "PASSWORD")
+PORT = config.get("CLUSTER", "PORT")
+
+# Redshift aborts one of two concurrent transactions that conflict with
+# this error, and rerunning the aborted one is safe. The partition lock should
+# prevent it, so retrying is only a fallback.
+SERIALIZATION_ERROR = 'Serializable isolation violation'
+
+
+def month_partitions(start, end):
+    """List the year/month partitions of log-data in a date range.
+
+    Arguments:
+        start (str) - first month, as YYYY-MM
+        end (str) - last month, as YYYY-MM, included in the range
+
+    Returns:
+        partitions (list) - (year, month) tuples in order
+    """
+    year, month = [int(part) for part in start.split('-')]
+    end_year, end_month = [int(part) for part in end.split('-')]
+    partitions = []
+    while (year, month) <= (end_year, end_month):
+        partitions.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return partitions
+
+
+def partition_bounds(year, month):
+    """Format values that bound a month for the backfill statements.
+
+    Returns:
+        bounds (dict) - year and month, start and end as timestamps, and
+            start_ms and end_ms as epoch milliseconds
+    """
+    start = datetime.datetime(year, month, 1)
+    end = start + datetime.timedelta(
+        days=calendar.monthrange(year, month)[1]
+    )
+    epoch = datetime.datetime(1970, 1, 1)
+    return {
+        'year': year,
+        'month': month,
+        'start': start.strftime('%Y-%m-%d %H:%M:%S'),
+        'end': end.strftime('%Y-%m-%d %H:%M:%S'),
+        'start_ms': int((start - epoch).total_seconds()) * 1000,
+        'end_ms': int((end - epoch).total_seconds()) * 1000
+    }
+
+
+def backfill_partition(conn, year, month):
+    """Reload one month of songplays and time from its log-data partition.
+
+    The month's rows are deleted and inserted again in one transaction, so
+    rerunning a month replaces it and leaves every other month alone. The
+    tables are locked once the partition is staged, so concurrent partitions
+    take turns writing rather than conflicting.
+
+    Arguments:
+        conn (psycopg2.connect) - sql connection object
+        year (int) - partition year
+        month (int) - partition month
+
+    Returns:
+        rows (int) - number of songplays inserted
+    """
+    bounds = partition_bounds(year, month)
+    cur = conn.cursor()
+    cur.execute(backfill_staging_events_create)
+    cur.execute(backfill_staging_events_copy.format(**bounds))
+    cur.execute(backfill_partition_lock)
+    rows = 0
+    for query in backfill_partition_queries:
+        cur.execute(query.format(**bounds))
+        if query is songplay_partition_insert:
+            rows = cur.rowcount
+    conn.commit()
+    return rows
+
+
+def run_partition(year, month, retries=3):
+    """Backfill a partition on its own connection, retrying conflicts.
+
+    Arguments:
+        year (int) - partition year
+        month (int) - partition month
+        retries (int) - attempts after a serialization conflict
+
+    Returns:
+        rows (int) - number of songplays inserted
+        seconds (float) - time taken
+    """
+    start = time.time()
+    for attempt in range(retries + 1):
+        # Create a connection per partition, so the temp table is its own.
+        conn = psycopg2.connect(
+            "host={} dbname={} user={} password={} port={}".format(
+                HOST, DBNAME, USER, PASSWORD, PORT
+            )
+        )
+        try:
+            rows = backfill_partition(conn, year, month)
+            return rows, time.time() - start
+        except psycopg2.Error as e:
+            conn.rollback()
+            if SERIALIZATION_ERROR not in str(e) or attempt == retries:
+                raise
+            print('%d-%02d conflicted, retrying' % (year, month))
+        finally:
+            # Close the connection.
+            conn.close()
+
+
+def backfill_pipeline(start, end, max_workers=4):
+    """Backfill songplays and time for each month in a range.
+
+    Requires staging_songs to be loaded. The users, songs, and artists
+    dimensions are not touched.
+
+    Arguments:
+        start (str) - first month, as YYYY-MM
+        end (str) - last month, as YYYY-MM, included in the range
+        max_workers (int) - most partitions loaded at a time
+
+    Returns:
+        failed (list) - (year, month) tuples of partitions that failed
+    """
+    partitions = month_partitions(start, end)
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(run_partition, year, month): (year, month)
+            for year, month in partitions
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            year, month = futures[future]
+            try:
+                rows, seconds = future.result()
+                print('[%d/%d] %d-%02d: %d songplays in %.1f seconds '
+                      '(%.0f rows/second)' % (
+                          done, len(partitions), year, month, rows, seconds,
+                          rows / seconds if seconds else 0
+                      ))
+            except Exception as e:
+                print('[%d/%d] %d-%02d failed: %s' % (
+                    done, len(partitions), year, month, e
+                ))
+                failed.append((year, month))
+    return failed
+
+
+if __name__ == '__main__':
+    # Parse command line args.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--start', required=True)
+    parser.add_argument('--end', required=True)
+    parser.add_argument('--workers', default=4, type=int)
+    args = parser.parse_args()
+
+    if backfill_pipeline(args.start, args.end, args.workers):
+        raise SystemExit(1)
@@ -1,6 +1,9 @@
+import argparse
 import configparser
 import os
+import time
 import psycopg2
+from local_dialect import DIALECTS, connect, execute_query
 from sql_queries import create_table_queries, drop_table_queries
 
 config = configparser.ConfigParser()
@@ -18,45 +21,62 @@ PASSWORD = config.get("CLUSTER", "PASSWORD")
 PORT = config.get("CLUSTER", "PORT")
 
 
-def drop_tables(cur, conn):
+def drop_tables(cur, conn, dialect=None):
     """Drop tables using statements in the drop_table_queries list.
 
     Arguments:
         cur (psycopg2.cursor) - sql cursor object
         conn (psycopg2.connect) - sql connection object
+        dialect (str) - local dialect to translate to, None for Redshift
     """
     for query in drop_table_queries:
-        cur.execute(query)
+        execute_query(cur, query, dialect)
         conn.commit()
 
 
-def create_tables(cur, conn):
+def create_tables(cur, conn, dialect=None):
     """Create tables using statements in the create_table_queries list.
 
     Arguments:
         cur (psycopg2.cursor) - sql cursor object
         conn (psycopg2.connect) - sql connection object
+        dialect (str) - local dialect to translate to, None for Redshift
     """
     for query in create_table_queries:
-        cur.execute(query)
+        execute_query(cur, query, dialect)
         conn.commit()
 
 
-def create_tables_pipeline():
-    """Drop tables if they exist, then create them."""
+def create_tables_pipeline(dialect=None):
+    """Drop tables if they exist, then create them.
+
+    Arguments:
+        dialect (str) - run against the local database for this dialect
+            instead of Redshift
+    """
+    start = time.time()
     # Create connection and cursor.
-    conn = psycopg2.connect(
-        "host={} dbname={} user={} password={} port={}".format(
-            HOST, DBNAME, USER, PASSWORD, PORT
+    if dialect:
+        conn = connect(dialect)
+    else:
+        conn = psycopg2.connect(
+            "host={} dbname={} user={} password={} port={}".format(
+                HOST, DBNAME, USER, PASSWORD, PORT
+            )
         )
-    )
     cur = conn.cursor()
     # Drop the tables if they exist and create them again.
-    drop_tables(cur, conn)
-    create_tables(cur, conn)
+    drop_tables(cur, conn, dialect)
+    create_tables(cur, conn, dialect)
     # Close the connection.
     conn.close()
+    print('Created tables in %.1f seconds' % (time.time() - start))
 
 
 if __name__ == "__main__":
-    main()
+    # Parse command line args.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dialect', default=None, choices=DIALECTS)
+    args = parser.parse_args()
+
+    create_tables_pipeline(args.dialect)
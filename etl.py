@@ -1,7 +1,18 @@
+import argparse
 import configparser
 import os
+import re
+import time
 import psycopg2
-from sql_queries import copy_table_queries, insert_table_queries
+from backfill import partition_bounds
+from local_dialect import DIALECTS, connect, execute_query
+from sql_queries import (
+    clear_staging_queries, copy_table_queries, insert_table_queries,
+    scd_load_queries, scd_staging_queries, shadow_table_acl,
+    shadow_table_create, shadow_table_drop, shadow_table_grant,
+    shadow_table_swap, slim_copy_table_queries, star_schema_tables,
+    user_history_later
+)
 
 config = configparser.ConfigParser()
 # Check to see which environment the code is running in.
@@ -18,35 +29,228 @@ PASSWORD = config.get("CLUSTER", "PASSWORD")
 PORT = config.get("CLUSTER", "PORT")
 
 
-def load_staging_tables(cur, conn):
+SHADOW_REFERENCE = re.compile(
+    r'\b(INTO|FROM|JOIN)\s+(%s)\b' % '|'.join(star_schema_tables),
+    re.IGNORECASE
+)
+
+# One entry of a table's access list, such as "group dashboards=r/brent".
+# An empty grantee means PUBLIC.
+ACL_ITEM = re.compile(r'"?(?P<grantee>[^=",{}]*)=(?P<privileges>[\w*]*)/'
+                      r'(?P<grantor>[^,"}]*)"?')
+ACL_PRIVILEGES = {
+    'r': 'SELECT', 'a': 'INSERT', 'w': 'UPDATE', 'd': 'DELETE',
+    'x': 'REFERENCES', 'D': 'DROP'
+}
+
+
+def load_staging_tables(cur, conn, commit=True, dialect=None,
+                        queries=copy_table_queries):
     """Load data from S3 into the staging tables.
 
     Arguments:
         cur (psycopg2.cursor) - sql cursor object
         conn (psycopg2.connect) - sql connection object
+        commit (bool) - commit after each statement
+        dialect (str) - local dialect to translate to, None for Redshift
+        queries (list) - statements that load the staging tables
     """
-    for query in copy_table_queries:
+    for query in queries:
         print('Running:\n%s' % query)
-        cur.execute(query)
-        conn.commit()
+        execute_query(cur, query, dialect)
+        if commit:
+            conn.commit()
 
 
-def insert_tables(cur, conn):
+def insert_tables(cur, conn, dialect=None, queries=insert_table_queries):
     """Transfer data from staging tables to fact and dimension tables for
     analytics queries.
 
+    Arguments:
+        cur (psycopg2.cursor) - sql cursor object
+        conn (psycopg2.connect) - sql connection object
+        dialect (str) - local dialect to translate to, None for Redshift
+        queries (list) - insert statements to run
+    """
+    for query in queries:
+        print('Running:\n%s' % query)
+        execute_query(cur, query, dialect)
+        conn.commit()
+
+
+def shadow_query(query):
+    """Point a star schema insert at the shadow tables.
+
+    Arguments:
+        query (str) - insert statement reading and writing star schema tables
+
+    Returns:
+        query (str) - the same statement using the <table>_shadow tables
+    """
+    return SHADOW_REFERENCE.sub(r'\1 \2_shadow', query)
+
+
+def table_grants(cur, table):
+    """Build the statements granting a table's privileges on its shadow.
+
+    The owner's own privileges are skipped, since the loader owns the shadow
+    table it creates.
+
+    Arguments:
+        cur (psycopg2.cursor) - sql cursor object
+        table (str) - live star schema table
+
+    Returns:
+        grants (list) - GRANT statements for the <table>_shadow table
+    """
+    cur.execute(shadow_table_acl.format(table))
+    row = cur.fetchone()
+    grants = []
+    for item in ACL_ITEM.finditer(row[0] if row and row[0] else ''):
+        grantee = item.group('grantee')
+        if grantee == item.group('grantor'):
+            continue
+        privileges = [
+            ACL_PRIVILEGES[letter] for letter in item.group('privileges')
+            if letter in ACL_PRIVILEGES
+        ]
+        if not privileges:
+            continue
+        if grantee.startswith('group '):
+            grantee = 'GROUP ' + grantee[len('group '):]
+        grants.append(shadow_table_grant.format(
+            privileges=', '.join(privileges), table=table,
+            grantee=grantee or 'PUBLIC'
+        ))
+    return grants
+
+
+def swap_tables(cur, conn):
+    """Rebuild the star schema in shadow tables and swap them in.
+
+    Nothing is committed until every shadow table is built and renamed over
+    its live table, so readers see either the old or the new star schema,
+    never a partial load. ALTER TABLE APPEND can't run inside a transaction
+    block, so the swap uses DROP and RENAME, which can. The live tables'
+    grants are copied to the shadow tables first. Views on the live tables
+    block the DROP, so the star schema must not have any.
+
     Arguments:
         cur (psycopg2.cursor) - sql cursor object
         conn (psycopg2.connect) - sql connection object
     """
+    for table in star_schema_tables:
+        cur.execute(shadow_table_drop.format(table))
+        cur.execute(shadow_table_create.format(table))
+        for grant in table_grants(cur, table):
+            cur.execute(grant)
     for query in insert_table_queries:
+        query = shadow_query(query)
         print('Running:\n%s' % query)
         cur.execute(query)
+    for table in star_schema_tables:
+        cur.execute(shadow_table_swap.format(table))
+    conn.commit()
+
+
+def etl_initial_load_pipeline(dialect=None):
+    """Populate the tables with S3 data specified in dwh.cfg.
+
+    Arguments:
+        dialect (str) - load the local database for this dialect from the
+            local copy of the S3 data instead of loading Redshift
+    """
+    start = time.time()
+    # Create connection and cursor.
+    if dialect:
+        conn = connect(dialect)
+    else:
+        conn = psycopg2.connect(
+            "host={} dbname={} user={} password={} port={}".format(
+                HOST, DBNAME, USER, PASSWORD, PORT
+            )
+        )
+    cur = conn.cursor()
+    # Load staging tables then insert data into the star schema.
+    load_staging_tables(cur, conn, dialect=dialect)
+    insert_tables(cur, conn, dialect)
+    # Close the connection.
+    conn.close()
+    print('Loaded tables in %.1f seconds' % (time.time() - start))
+
+
+def etl_scd_load_pipeline(batch, dialect=None):
+    """Load one month of log-data, keeping type 2 history for users.
+
+    Staging is emptied and loaded with the batch's log-data partition and
+    all of song-data. The batch's month of songplays and time is replaced,
+    new songs and artists are added, and the history of the batch's users is
+    rebuilt from the start of the month, all with a single commit. Months
+    load in order: a batch is rejected if any of its users already have
+    versions from a later month, since rebuilding it would lose them.
+
+    Arguments:
+        batch (str) - month to load, as YYYY-MM
+        dialect (str) - run against the local database for this dialect
+            instead of Redshift
+
+    Raises:
+        ValueError - a later month is already loaded for the batch's users
+    """
+    start = time.time()
+    # Create connection and cursor.
+    if dialect:
+        conn = connect(dialect)
+    else:
+        conn = psycopg2.connect(
+            "host={} dbname={} user={} password={} port={}".format(
+                HOST, DBNAME, USER, PASSWORD, PORT
+            )
+        )
+    cur = conn.cursor()
+    year, month = [int(part) for part in batch.split('-')]
+    bounds = partition_bounds(year, month)
+    try:
+        # Reload staging with the batch.
+        for query in scd_staging_queries:
+            query = query.format(**bounds)
+            print('Running:\n%s' % query)
+            execute_query(cur, query, dialect)
+        execute_query(cur, user_history_later.format(**bounds), dialect)
+        later = cur.fetchone()[0]
+        if later:
+            raise ValueError(
+                '%d users in %s already have history from a later month, '
+                'load the months in order' % (later, batch)
+            )
+        # Replace the batch in the star schema and users history.
+        for query in scd_load_queries:
+            query = query.format(**bounds)
+            print('Running:\n%s' % query)
+            execute_query(cur, query, dialect)
         conn.commit()
+    except Exception:
+        # DuckDB cursors autocommit, so there is nothing to roll back.
+        if dialect != 'duckdb':
+            conn.rollback()
+        raise
+    finally:
+        # Close the connection.
+        conn.close()
+    print('Loaded tables in %.1f seconds' % (time.time() - start))
 
 
-def etl_initial_load_pipeline():
-    """Populate the tables with S3 data specified in dwh.cfg."""
+def etl_slim_load_pipeline():
+    """Populate the tables through slim, pre-filtered temp staging tables.
+
+    Only NextSong events are copied to the staging bucket, and only the
+    columns read by the inserts are loaded. The temp tables live as long as
+    the connection, so the inserts run on the same one.
+    """
+    # Only slim loads touch S3 from here, so import boto3 on demand.
+    from slim_staging import prepare_slim_staging
+    start = time.time()
+    prepare_slim_staging()
     # Create connection and cursor.
     conn = psycopg2.connect(
         "host={} dbname={} user={} password={} port={}".format(
@@ -54,12 +258,59 @@ def etl_initial_load_pipeline():
         )
     )
     cur = conn.cursor()
-    # Load staging tables then insert data into the star schema.
-    load_staging_tables(cur, conn)
+    # Load the temp staging tables then insert data into the star schema.
+    load_staging_tables(cur, conn, queries=slim_copy_table_queries)
     insert_tables(cur, conn)
     # Close the connection.
     conn.close()
+    print('Loaded tables in %.1f seconds' % (time.time() - start))
+
+
+def etl_atomic_load_pipeline():
+    """Reload the tables with S3 data in a single transaction."""
+    start = time.time()
+    # Create connection and cursor.
+    conn = psycopg2.connect(
+        "host={} dbname={} user={} password={} port={}".format(
+            HOST, DBNAME, USER, PASSWORD, PORT
+        )
+    )
+    cur = conn.cursor()
+    # Reload staging tables and swap in the star schema with one commit.
+    try:
+        load_staging_tables(
+            cur, conn, commit=False,
+            queries=clear_staging_queries + copy_table_queries
+        )
+        swap_tables(cur, conn)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        # Close the connection.
+        conn.close()
+    print('Loaded tables in %.1f seconds' % (time.time() - start))
 
 
 if __name__ == "__main__":
-    etl_initial_load_pipeline()
+    # Parse command line args.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--atomic', default=False, type=bool)
+    parser.add_argument('--scd', default=False, type=bool)
+    parser.add_argument('--month', default=None)
+    parser.add_argument('--slim', default=False, type=bool)
+    parser.add_argument('--dialect', default=None, choices=DIALECTS)
+    args = parser.parse_args()
+
+    if args.atomic and args.dialect:
+        parser.error('--atomic only runs against Redshift')
+    if args.atomic:
+        etl_atomic_load_pipeline()
+    elif args.scd:
+        if not args.month:
+            parser.error('--scd needs --month YYYY-MM')
+        etl_scd_load_pipeline(args.month, args.dialect)
+    elif args.slim:
+        etl_slim_load_pipeline()
+    else:
+        etl_initial_load_pipeline(args.dialect)
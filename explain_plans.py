@@ -0,0 +1,246 @@
+import argparse
+import configparser
+import os
+import re
+import shutil
+import psycopg2
+from sql_queries import dashboard_queries, insert_table_queries
+
+config = configparser.ConfigParser()
+# Check to see which environment the code is running in.
+if 'Brent' in os.uname().nodename:
+    config.read('/Users/brent/projects/redjam/dwh.cfg')
+else:
+    config.read('/usr/local/projects/redjam/dwh.cfg')
+
+
+HOST = config.get("CLUSTER", "HOST")
+DBNAME = config.get("CLUSTER", "DBNAME")
+USER = config.get("CLUSTER", "USER")
+PASSWORD = config.get("CLUSTER", "PASSWORD")
+PORT = config.get("CLUSTER", "PORT")
+
+PLAN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plans')
+RECORDED_DIR = os.path.join(PLAN_DIR, 'recorded')
+BASELINE_DIR = os.path.join(PLAN_DIR, 'baseline')
+
+# Join distribution strategies that move data between nodes at query time.
+# DS_DIST_NONE and DS_DIST_ALL_NONE are collocated and considered free.
+COSTLY_STRATEGIES = [
+    'DS_BCAST_INNER', 'DS_DIST_BOTH', 'DS_DIST_ALL_INNER', 'DS_DIST_INNER',
+    'DS_DIST_OUTER'
+]
+
+# Allow the estimated cost to drift by this much before flagging it.
+COST_TOLERANCE = 0.10
+
+PLAN_NODE = re.compile(
+    r'XN (?P<node>.+?)\s+\(cost=(?P<startup>[\d.]+)\.\.(?P<total>[\d.]+) '
+    r'rows=(?P<rows>\d+) width=(?P<width>\d+)\)'
+)
+INSERT_TARGET = re.compile(r'INSERT INTO\s+(\w+)', re.IGNORECASE)
+
+
+def collect_queries():
+    """Gather the statements whose plans are tracked by the harness.
+
+    Insert statements are named after the table they insert into, dashboard
+    queries after the name they were registered under in sql_queries.
+
+    Returns:
+        queries (dict) - plan name mapped to the SQL statement
+    """
+    queries = {}
+    for query in insert_table_queries:
+        table = INSERT_TARGET.search(query).group(1)
+        queries['%s_insert' % table] = query
+    for name, query in dashboard_queries.items():
+        queries[name] = query
+    return queries
+
+
+def capture_plans(cur, queries, plan_dir=RECORDED_DIR):
+    """Run EXPLAIN for each query and record the plan text to disk.
+
+    Arguments:
+        cur (psycopg2.cursor) - sql cursor object
+        queries (dict) - plan name mapped to the SQL statement
+        plan_dir (str) - directory the plans are written to
+    """
+    os.makedirs(plan_dir, exist_ok=True)
+    for name, query in queries.items():
+        print('Explaining %s' % name)
+        cur.execute('EXPLAIN ' + query)
+        plan = '\n'.join(row[0] for row in cur.fetchall())
+        with open(os.path.join(plan_dir, '%s.txt' % name), 'w') as f:
+            f.write(plan + '\n')
+
+
+def read_plans(plan_dir):
+    """Read recorded plans from a directory.
+
+    Arguments:
+        plan_dir (str) - directory holding one <name>.txt file per plan
+
+    Returns:
+        plans (dict) - plan name mapped to the plan text
+    """
+    plans = {}
+    if not os.path.isdir(plan_dir):
+        return plans
+    for file_name in sorted(os.listdir(plan_dir)):
+        if file_name.endswith('.txt'):
+            with open(os.path.join(plan_dir, file_name)) as f:
+                plans[file_name[:-len('.txt')]] = f.read()
+    return plans
+
+
+def parse_plan(plan):
+    """Pull the join distribution strategies and cost out of a plan.
+
+    Arguments:
+        plan (str) - text output of a Redshift EXPLAIN
+
+    Returns:
+        summary (dict) - the plan's total cost, estimated rows, and a list
+            of (join node, distribution strategy) tuples in plan order
+
+    Raises:
+        ValueError - the text holds no plan nodes
+    """
+    summary = {'cost': 0.0, 'rows': 0, 'joins': []}
+    matches = list(PLAN_NODE.finditer(plan))
+    if not matches:
+        raise ValueError('no plan nodes found')
+    for i, match in enumerate(matches):
+        node = match.group('node')
+        # The first node is the root, and its total cost covers the plan.
+        if i == 0:
+            summary['cost'] = float(match.group('total'))
+            summary['rows'] = int(match.group('rows'))
+        if 'Join' in node or 'Nested Loop' in node:
+            strategy = re.search(r'\bDS_\w+', node)
+            operator = re.sub(r'\s*\bDS_\w+', '', node).strip()
+            summary['joins'].append(
+                (operator, strategy.group(0) if strategy else None)
+            )
+    return summary
+
+
+def compare_plans(baseline, recorded, tolerance=COST_TOLERANCE):
+    """Compare a recorded plan to its baseline and describe regressions.
+
+    A plan regresses when it uses a costly distribution strategy more often
+    than the baseline did, or when its estimated cost grows by more than the
+    tolerance.
+
+    Arguments:
+        baseline (str) - baseline plan text
+        recorded (str) - recorded plan text
+        tolerance (float) - allowed relative growth of the estimated cost
+
+    Returns:
+        regressions (list) - human readable description of each regression
+    """
+    regressions = []
+    old, new = parse_plan(baseline), parse_plan(recorded)
+    old_strategies = [s for _, s in old['joins']]
+    new_strategies = [s for _, s in new['joins']]
+    for strategy in COSTLY_STRATEGIES:
+        before = old_strategies.count(strategy)
+        after = new_strategies.count(strategy)
+        if after > before:
+            regressions.append(
+                '%s joins went from %d to %d' % (strategy, before, after)
+            )
+    if new['cost'] > old['cost'] * (1 + tolerance):
+        regressions.append(
+            'cost went from %.2f to %.2f' % (old['cost'], new['cost'])
+        )
+    return regressions
+
+
+def check_plans(baseline_dir=BASELINE_DIR, recorded_dir=RECORDED_DIR,
+                tolerance=COST_TOLERANCE, tracked=None):
+    """Compare every recorded plan against its baseline. Runs offline.
+
+    A tracked plan missing from either directory, or a plan that can't be
+    parsed, fails the check like a regression does.
+
+    Arguments:
+        baseline_dir (str) - directory holding the baseline plans
+        recorded_dir (str) - directory holding the recorded plans
+        tolerance (float) - allowed relative growth of the estimated cost
+        tracked (list) - plan names that must be present, defaults to the
+            names from collect_queries
+
+    Returns:
+        report (dict) - plan name mapped to its list of regressions, for
+            plans that regressed or could not be checked
+    """
+    if tracked is None:
+        tracked = collect_queries()
+    baselines = read_plans(baseline_dir)
+    recordings = read_plans(recorded_dir)
+    report = {}
+    for name in sorted(set(tracked) | set(baselines) | set(recordings)):
+        if name not in baselines:
+            regressions = ['no baseline plan']
+        elif name not in recordings:
+            regressions = ['no recorded plan']
+        else:
+            try:
+                regressions = compare_plans(
+                    baselines[name], recordings[name], tolerance
+                )
+            except ValueError as e:
+                regressions = ['unparsable plan: %s' % e]
+        if regressions:
+            report[name] = regressions
+            for regression in regressions:
+                print('%s: REGRESSION %s' % (name, regression))
+        else:
+            print('%s: ok' % name)
+    return report
+
+
+def accept_plans(baseline_dir=BASELINE_DIR, recorded_dir=RECORDED_DIR):
+    """Promote the recorded plans to be the new baselines."""
+    os.makedirs(baseline_dir, exist_ok=True)
+    for name in read_plans(recorded_dir):
+        shutil.copy(
+            os.path.join(recorded_dir, '%s.txt' % name),
+            os.path.join(baseline_dir, '%s.txt' % name)
+        )
+        print('Accepted baseline for %s' % name)
+
+
+def capture_plans_pipeline():
+    """Record EXPLAIN plans for the tracked queries from the cluster."""
+    # Create connection and cursor.
+    conn = psycopg2.connect(
+        "host={} dbname={} user={} password={} port={}".format(
+            HOST, DBNAME, USER, PASSWORD, PORT
+        )
+    )
+    cur = conn.cursor()
+    capture_plans(cur, collect_queries())
+    # Close the connection.
+    conn.close()
+
+
+if __name__ == '__main__':
+    # Parse command line args.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--capture', default=False, type=bool)
+    parser.add_argument('--check', default=False, type=bool)
+    parser.add_argument('--accept', default=False, type=bool)
+    args = parser.parse_args()
+
+    if args.capture:
+        capture_plans_pipeline()
+    if args.check:
+        if check_plans():
+            raise SystemExit(1)
+    if args.accept:
+        accept_plans()
@@ -0,0 +1,278 @@
+import argparse
+import configparser
+import datetime
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import psycopg2
+from infrastructure import create_session
+from local_dialect import DIALECTS, connect, execute_query
+from sql_queries import (
+    EXPORT_DATA, export_partition_fingerprints, export_partition_select,
+    export_table_select, export_unload
+)
+
+config = configparser.ConfigParser()
+# Check to see which environment the code is running in.
+if 'Brent' in os.uname().nodename:
+    config.read('/Users/brent/projects/redjam/dwh.cfg')
+else:
+    config.read('/usr/local/projects/redjam/dwh.cfg')
+
+
+HOST = config.get("CLUSTER", "HOST")
+DBNAME = config.get("CLUSTER", "DBNAME")
+USER = config.get("CLUSTER", "USER")
+PASSWORD = config.get("CLUSTER", "PASSWORD")
+PORT = config.get("CLUSTER", "PORT")
+
+MANIFEST_KEY = 'manifest.json'
+# Tables exported one year/month partition at a time.
+PARTITIONED_TABLES = ['songplays', 'time']
+# Small dimension tables, exported whole on every run.
+DIMENSION_TABLES = ['users', 'songs', 'artists']
+
+
+class S3Store:
+    """Export location in S3.
+
+    Arguments:
+        s3_client (boto3.client) - S3 client
+        uri (str) - S3 URI of the export root
+    """
+
+    def __init__(self, s3_client, uri):
+        self.s3_client = s3_client
+        self.bucket, self.prefix = re.match(
+            r's3://([^/]+)/?(.*)', uri.strip("'")
+        ).groups()
+        self.prefix = self.prefix.rstrip('/')
+
+    def _key(self, key):
+        return '%s/%s' % (self.prefix, key) if self.prefix else key
+
+    def uri(self, key):
+        return 's3://%s/%s' % (self.bucket, self._key(key))
+
+    def read(self, key):
+        try:
+            return self.s3_client.get_object(
+                Bucket=self.bucket, Key=self._key(key)
+            )['Body'].read().decode('utf-8')
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+
+    def write(self, key, body):
+        self.s3_client.put_object(
+            Bucket=self.bucket, Key=self._key(key), Body=body.encode('utf-8')
+        )
+
+    def delete(self, prefix):
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(
+            Bucket=self.bucket, Prefix=self._key(prefix)
+        ):
+            for item in page.get('Contents', []):
+                self.s3_client.delete_object(
+                    Bucket=self.bucket, Key=item['Key']
+                )
+
+
+class LocalStore:
+    """Export location in a local directory, standing in for S3.
+
+    Arguments:
+        root (str) - local directory of the export root
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def uri(self, key):
+        return os.path.join(self.root, key)
+
+    def read(self, key):
+        if not os.path.exists(self.uri(key)):
+            return None
+        with open(self.uri(key)) as f:
+            return f.read()
+
+    def write(self, key, body):
+        os.makedirs(os.path.dirname(self.uri(key)), exist_ok=True)
+        with open(self.uri(key), 'w') as f:
+            f.write(body)
+
+    def delete(self, prefix):
+        shutil.rmtree(self.uri(prefix), ignore_errors=True)
+
+
+def partition_fingerprints(cur):
+    """Fingerprint each year/month partition of songplays.
+
+    A partition's fingerprint is its row count and lowest and highest
+    songplay_id, so reloading a month changes it even if the count doesn't.
+
+    Arguments:
+        cur (psycopg2.cursor) - sql cursor object
+
+    Returns:
+        fingerprints (dict) - partition key mapped to its fingerprint
+    """
+    cur.execute(export_partition_fingerprints)
+    return {
+        'year=%d/month=%d' % (year, month): [count, min_id, max_id]
+        for year, month, count, min_id, max_id in cur.fetchall()
+    }
+
+
+def partition_unloads(store, partition):
+    """Build the UNLOAD statements for one partition of each table.
+
+    Arguments:
+        store (S3Store or LocalStore) - export location
+        partition (str) - partition key, such as "year=2018/month=11"
+
+    Returns:
+        unloads (list) - (manifest key, location, UNLOAD statement) tuples
+    """
+    year, month = [int(part.split('=')[1]) for part in partition.split('/')]
+    start = datetime.datetime(year, month, 1)
+    end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+    unloads = []
+    for table in PARTITIONED_TABLES:
+        location = store.uri('%s/%s/' % (table, partition))
+        select = export_partition_select.format(
+            table=table, start=start, end=end
+        )
+        unloads.append((
+            '%s/%s' % (table, partition), location,
+            export_unload.format(select=select, location=location)
+        ))
+    return unloads
+
+
+def run_unload(query, dialect=None, local_conn=None):
+    """Run one UNLOAD on its own connection.
+
+    Arguments:
+        query (str) - UNLOAD statement
+        dialect (str) - local dialect to translate to, None for Redshift
+        local_conn - shared local database connection, each call uses its
+            own cursor on it
+    """
+    if local_conn is not None:
+        execute_query(local_conn.cursor(), query, dialect)
+        return
+    # Create a connection per UNLOAD so they run on the cluster in parallel.
+    conn = psycopg2.connect(
+        "host={} dbname={} user={} password={} port={}".format(
+            HOST, DBNAME, USER, PASSWORD, PORT
+        )
+    )
+    try:
+        conn.cursor().execute(query)
+    finally:
+        # Close the connection.
+        conn.close()
+
+
+def export_pipeline(store, dialect=None, max_workers=4):
+    """Export the star schema to Parquet, rewriting only changed partitions.
+
+    The manifest at the export root records each exported partition's
+    fingerprint and location. A partition is unloaded again only when its
+    fingerprint differs from the manifest, and partitions no longer in the
+    warehouse are deleted. Failed unloads are left out of the manifest, so
+    the next export retries them.
+
+    Arguments:
+        store (S3Store or LocalStore) - export location
+        dialect (str) - export from the local database for this dialect
+            instead of Redshift
+        max_workers (int) - most UNLOADs run at a time
+
+    Returns:
+        failed (list) - manifest keys of the unloads that failed
+    """
+    manifest = json.loads(store.read(MANIFEST_KEY) or '{"partitions": {}}')
+    exported = manifest['partitions']
+    # Create connection and cursor.
+    if dialect:
+        conn = connect(dialect)
+    else:
+        conn = psycopg2.connect(
+            "host={} dbname={} user={} password={} port={}".format(
+                HOST, DBNAME, USER, PASSWORD, PORT
+            )
+        )
+    fingerprints = partition_fingerprints(conn.cursor())
+    # Queue the changed partitions, then every dimension table.
+    unloads = []
+    for partition, fingerprint in sorted(fingerprints.items()):
+        for key, location, query in partition_unloads(store, partition):
+            if exported.get(key, {}).get('fingerprint') != fingerprint:
+                unloads.append((key, fingerprint, location, query))
+    for table in DIMENSION_TABLES:
+        location = store.uri('%s/' % table)
+        select = export_table_select.format(table=table)
+        unloads.append((
+            table, None, location,
+            export_unload.format(select=select, location=location)
+        ))
+    # Drop partitions that no longer exist in the warehouse.
+    for key in list(exported):
+        if '/' in key and key.split('/', 1)[1] not in fingerprints:
+            store.delete(key + '/')
+            del exported[key]
+    print('Exporting %d of %d partitions and %d tables' % (
+        len(unloads) - len(DIMENSION_TABLES),
+        len(fingerprints) * len(PARTITIONED_TABLES), len(DIMENSION_TABLES)
+    ))
+    local_conn = conn if dialect else None
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(run_unload, query, dialect, local_conn):
+                (key, fingerprint, location)
+            for key, fingerprint, location, query in unloads
+        }
+        for future in as_completed(futures):
+            key, fingerprint, location = futures[future]
+            try:
+                future.result()
+                exported[key] = {
+                    'fingerprint': fingerprint,
+                    'location': location,
+                    'exported_at': datetime.datetime.utcnow().isoformat()
+                }
+                print('Exported %s' % key)
+            except Exception as e:
+                print('Failed to export %s: %s' % (key, e))
+                failed.append(key)
+    # Close the connection.
+    conn.close()
+    manifest['exported_at'] = datetime.datetime.utcnow().isoformat()
+    store.write(MANIFEST_KEY, json.dumps(manifest, indent=2, sort_keys=True))
+    return failed
+
+
+if __name__ == '__main__':
+    # Parse command line args.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dialect', default=None, choices=DIALECTS)
+    parser.add_argument('--export-dir', default=None)
+    parser.add_argument('--workers', default=4, type=int)
+    args = parser.parse_args()
+
+    if args.export_dir:
+        store = LocalStore(args.export_dir)
+    else:
+        session = create_session(
+            os.environ['DW_AWS_ACCESS_KEY_ID'],
+            os.environ['DW_AWS_SECRET_ACCESS_KEY']
+        )
+        store = S3Store(session.client('s3'), EXPORT_DATA)
+    if export_pipeline(store, args.dialect, args.workers):
+        raise SystemExit(1)
@@ -0,0 +1,171 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from infrastructure import (
+    IDENTIFIER, create_clients, create_iam_role, create_redshift_cluster,
+    create_session, set_vpc_properties, wait_for_cluster
+)
+
+
+def environment_identifier(name):
+    """Cluster identifier for a named environment.
+
+    Arguments:
+        name (str) - environment name, such as "test1"
+
+    Returns:
+        identifier (str) - Redshift cluster identifier
+    """
+    return ('%s-%s' % (IDENTIFIER, name)).lower()
+
+
+def build_environment(redshift_client, ec2_client, role_arn, name,
+                      sleep=time.sleep):
+    """Create an environment's cluster and open its port once available.
+
+    Arguments:
+        redshift_client (boto3.client) - Redshift client
+        ec2_client (boto3.resource) - EC2 client for this environment
+        role_arn (str) - ARN for the IAM Role
+        name (str) - environment name
+        sleep (function) - called with the number of seconds to wait
+
+    Returns:
+        cluster_properties (dict) - cluster properties
+    """
+    identifier = environment_identifier(name)
+    create_redshift_cluster(redshift_client, role_arn, identifier)
+    cluster_properties = wait_for_cluster(
+        redshift_client, 'available', identifier, sleep=sleep
+    )
+    set_vpc_properties(ec2_client, cluster_properties['VpcId'])
+    return cluster_properties
+
+
+def pause_environment(redshift_client, name, sleep=time.sleep):
+    """Pause an environment's cluster and wait until it is paused."""
+    identifier = environment_identifier(name)
+    redshift_client.pause_cluster(ClusterIdentifier=identifier)
+    return wait_for_cluster(redshift_client, 'paused', identifier, sleep=sleep)
+
+
+def resume_environment(redshift_client, name, sleep=time.sleep):
+    """Resume a paused environment's cluster and wait until available."""
+    identifier = environment_identifier(name)
+    redshift_client.resume_cluster(ClusterIdentifier=identifier)
+    return wait_for_cluster(
+        redshift_client, 'available', identifier, sleep=sleep
+    )
+
+
+def delete_environment(redshift_client, name, sleep=time.sleep):
+    """Delete an environment's cluster and wait until it is gone."""
+    identifier = environment_identifier(name)
+    redshift_client.delete_cluster(
+        ClusterIdentifier=identifier, SkipFinalClusterSnapshot=True
+    )
+    return wait_for_cluster(
+        redshift_client, 'deleted', identifier, sleep=sleep
+    )
+
+
+def run_fleet(action, names, session, max_workers=None, sleep=time.sleep):
+    """Run an action against several environments at once.
+
+    Clients are created once from the shared session, since boto3 clients
+    can be shared between threads but sessions and resources can't. The IAM
+    role is shared by every environment and is left in place on delete.
+
+    Arguments:
+        action (str) - one of "build", "pause", "resume", or "delete"
+        names (list) - environment names
+        session (boto3.session.Session) - session to create clients from
+        max_workers (int) - most environments to work on at a time,
+            defaults to all of them
+        sleep (function) - called with the number of seconds to wait
+
+    Returns:
+        results (dict) - environment name mapped to its cluster properties,
+            or to the exception raised while working on it
+    """
+    _, _, iam_client, redshift_client = create_clients(
+        None, None, session=session
+    )
+    if action == 'build':
+        role_arn = create_iam_role(iam_client)
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers or len(names)) as pool:
+        futures = {}
+        for name in names:
+            if action == 'build':
+                future = pool.submit(
+                    build_environment, redshift_client,
+                    session.resource('ec2'), role_arn, name, sleep
+                )
+            elif action == 'pause':
+                future = pool.submit(
+                    pause_environment, redshift_client, name, sleep
+                )
+            elif action == 'resume':
+                future = pool.submit(
+                    resume_environment, redshift_client, name, sleep
+                )
+            elif action == 'delete':
+                future = pool.submit(
+                    delete_environment, redshift_client, name, sleep
+                )
+            else:
+                raise ValueError('Unknown action %s' % action)
+            futures[future] = name
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+                print('Finished %s of %s' % (action, name))
+            except Exception as e:
+                print('Failed %s of %s: %s' % (action, name, e))
+                results[name] = e
+    return results
+
+
+def report_fleet(action, results):
+    """Print each built or resumed cluster's endpoint and list failures.
+
+    Arguments:
+        action (str) - the action run_fleet ran
+        results (dict) - results returned by run_fleet
+
+    Returns:
+        failed (list) - names of the environments whose action failed
+    """
+    failed = []
+    for name, result in sorted(results.items()):
+        if isinstance(result, Exception):
+            failed.append(name)
+        elif action in ['build', 'resume']:
+            print('%s HOST: %s' % (name, result['Endpoint']['Address']))
+    return failed
+
+
+if __name__ == '__main__':
+    # Parse command line args.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--build', default=False, type=bool)
+    parser.add_argument('--pause', default=False, type=bool)
+    parser.add_argument('--resume', default=False, type=bool)
+    parser.add_argument('--delete', default=False, type=bool)
+    parser.add_argument('--names', nargs='+', required=True)
+    parser.add_argument('--workers', default=None, type=int)
+    args = parser.parse_args()
+
+    AWS_KEY = os.environ['DW_AWS_ACCESS_KEY_ID']
+    AWS_SECRET = os.environ['DW_AWS_SECRET_ACCESS_KEY']
+    session = create_session(AWS_KEY, AWS_SECRET)
+    failed = []
+    for action in ['build', 'pause', 'resume', 'delete']:
+        if getattr(args, action):
+            results = run_fleet(action, args.names, session, args.workers)
+            failed += report_fleet(action, results)
+    if failed:
+        raise SystemExit(1)
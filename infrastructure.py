@@ -5,6 +5,7 @@ import os
 import time
 import pandas as pd
 import boto3
+from botocore.exceptions import ClientError
 
 config = configparser.ConfigParser()
 # Check to see which environment the code is running in.
@@ -37,13 +38,7 @@ def create_infrastructure(aws_key, aws_secret):
     )
     role_arn = create_iam_role(iam_client)
     create_redshift_cluster(redshift_client, role_arn)
-    # Loop until the cluster status becomes "Available"
-    status = ""
-    while status.lower() != "available":
-        cluster_properties = get_cluster_properties(redshift_client)
-        status = cluster_properties['ClusterStatus']
-        print('Cluster status is %s' % status)
-        time.sleep(30)
+    cluster_properties = wait_for_cluster(redshift_client, 'available')
     set_vpc_properties(ec2_client, cluster_properties['VpcId'])
     print_cluster_properties(redshift_client)
 
@@ -94,12 +89,13 @@ def create_iam_role(iam_client):
     return role_arn
 
 
-def create_redshift_cluster(redshift_client, role_arn):
+def create_redshift_cluster(redshift_client, role_arn, identifier=IDENTIFIER):
     """Create the Redshift cluster and print properties.
 
     Arguments:
         redshift_client (boto3.client) - Redshift client
         role_arn (str) - ARN for the IAM Role
+        identifier (str) - cluster identifier
     """
     # Create the cluster if it doesn't exist.
     try:
@@ -108,7 +104,7 @@ def create_redshift_cluster(redshift_client, role_arn):
             NodeType=NODE_TYPE,
             NumberOfNodes=NUM_NODES,
             DBName=DBNAME,
-            ClusterIdentifier=IDENTIFIER,
+            ClusterIdentifier=identifier,
             MasterUsername=USER,
             MasterUserPassword=PASSWORD,
             IamRoles=[role_arn]
@@ -117,13 +113,14 @@ def create_redshift_cluster(redshift_client, role_arn):
         print(e)
 
 
-def print_cluster_properties(redshift_client):
+def print_cluster_properties(redshift_client, identifier=IDENTIFIER):
     """Print the clusters properties.
 
     Arguments:
         redshift_client (boto3.client) - Redshift client
+        identifier (str) - cluster identifier
     """
-    cluster_properties = get_cluster_properties(redshift_client)
+    cluster_properties = get_cluster_properties(redshift_client, identifier)
     print('HOST: %s' % cluster_properties['Endpoint']['Address'])
     property_keys = [
         'ClusterIdentifier', 'NodeType', 'ClusterStatus', 'MasterUsername',
@@ -136,21 +133,63 @@ def print_cluster_properties(redshift_client):
     print(dfshow)
 
 
-def get_cluster_properties(redshift_client):
+def get_cluster_properties(redshift_client, identifier=IDENTIFIER):
     """Helper function to get the cluster's properties.
 
     Arguments:
         redshift_client (boto3.client) - Redshift client
+        identifier (str) - cluster identifier
 
     Returns:
         cluster_properties (dict) - cluster properties
     """
     cluster_properties = redshift_client.describe_clusters(
-        ClusterIdentifier=IDENTIFIER
+        ClusterIdentifier=identifier
     )['Clusters'][0]
     return cluster_properties
 
 
+def wait_for_cluster(redshift_client, status, identifier=IDENTIFIER,
+                     delay=5, max_delay=60, timeout=3600, sleep=time.sleep):
+    """Poll the cluster with exponential backoff until it reaches a status.
+
+    Arguments:
+        redshift_client (boto3.client) - Redshift client
+        status (str) - status to wait for, or "deleted" to wait for the
+            cluster to disappear
+        identifier (str) - cluster identifier
+        delay (int) - seconds to wait after the first poll
+        max_delay (int) - longest wait between polls in seconds
+        timeout (int) - total seconds to wait before giving up
+        sleep (function) - called with the number of seconds to wait
+
+    Returns:
+        cluster_properties (dict) - cluster properties, None once deleted
+    """
+    waited = 0
+    while True:
+        try:
+            cluster_properties = get_cluster_properties(
+                redshift_client, identifier
+            )
+        except ClientError as e:
+            if (status == 'deleted' and
+                    e.response['Error']['Code'] == 'ClusterNotFound'):
+                return None
+            raise
+        current = cluster_properties['ClusterStatus']
+        print('Cluster %s status is %s' % (identifier, current))
+        if current.lower() == status:
+            return cluster_properties
+        if waited >= timeout:
+            raise TimeoutError(
+                'Cluster %s did not become %s' % (identifier, status)
+            )
+        sleep(delay)
+        waited += delay
+        delay = min(delay * 2, max_delay)
+
+
 def set_vpc_properties(ec2_client, vpc_id):
     """Open incoming TCP port to access the cluster endpoint.
 
@@ -201,31 +240,37 @@ def print_infrastructure(aws_key, aws_secret):
 
 
 ### UTILITIES
-def create_clients(aws_key, aws_secret):
+def create_session(aws_key, aws_secret):
+    """Create a boto3 session that clients can share.
+
+    Returns:
+        session (boto3.session.Session) - session for the project's region
+    """
+    return boto3.session.Session(
+        region_name=AWS_REGION, aws_access_key_id=aws_key,
+        aws_secret_access_key=aws_secret
+    )
+
+
+def create_clients(aws_key, aws_secret, session=None):
     """Create EC2, S3, IAM, and Redshift clients.
 
+    Arguments:
+        session (boto3.session.Session) - session to create the clients
+            from, a new one is created if not given
+
     Returns:
         ec2_client (boto3.resource) - EC2 client
         s3_client (boto3.resource) - S3 client
         iam_client (boto3.client) - IAM client
         redshift_client (boto3.client) - Redshift client
     """
-    ec2_client = boto3.resource(
-        'ec2', region_name=AWS_REGION, aws_access_key_id=aws_key,
-        aws_secret_access_key=aws_secret
-    )
-    s3_client = boto3.resource(
-        's3', region_name=AWS_REGION, aws_access_key_id=aws_key,
-        aws_secret_access_key=aws_secret
-    )
-    iam_client = boto3.client(
-        'iam', region_name=AWS_REGION, aws_access_key_id=aws_key,
-        aws_secret_access_key=aws_secret
-    )
-    redshift_client = boto3.client(
-        'redshift', region_name=AWS_REGION, aws_access_key_id=aws_key,
-        aws_secret_access_key=aws_secret
-    )
+    if session is None:
+        session = create_session(aws_key, aws_secret)
+    ec2_client = session.resource('ec2')
+    s3_client = session.resource('s3')
+    iam_client = session.client('iam')
+    redshift_client = session.client('redshift')
     return ec2_client, s3_client, iam_client, redshift_client
 
 
@@ -0,0 +1,292 @@
+import configparser
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import psycopg2
+
+config = configparser.ConfigParser()
+# Check to see which environment the code is running in.
+if 'Brent' in os.uname().nodename:
+    config.read('/Users/brent/projects/redjam/dwh.cfg')
+else:
+    config.read('/usr/local/projects/redjam/dwh.cfg')
+
+
+DATA_DIR = config.get("LOCAL", "DATA_DIR", fallback='data')
+POSTGRES_DSN = config.get("LOCAL", "POSTGRES_DSN", fallback='dbname=red_jam')
+DUCKDB_PATH = config.get("LOCAL", "DUCKDB_PATH", fallback='red_jam.duckdb')
+
+DIALECTS = ['postgres', 'duckdb']
+
+COPY_STATEMENT = re.compile(
+    r"^\s*COPY\s+(?P<table>\w+)\s+FROM\s+'?(?P<source>[^'\s]+)'?.*?"
+    r"\bJSON\s+'?(?P<json>[^'\s;]+)'?",
+    re.IGNORECASE | re.DOTALL
+)
+UNLOAD_STATEMENT = re.compile(
+    r"^\s*UNLOAD\s*\(\s*'(?P<select>(?:[^']|'')*)'\s*\)\s*"
+    r"TO\s+'(?P<location>[^']+)'",
+    re.IGNORECASE | re.DOTALL
+)
+CREATE_TABLE = re.compile(r'CREATE TABLE\s+(\w+)', re.IGNORECASE)
+IDENTITY_COLUMN = re.compile(
+    r'(?P<column>\w+)\s+(?P<type>\w+)\s+IDENTITY\s*\(\s*(?P<seed>\d+)\s*,'
+    r'\s*(?P<step>\d+)\s*\)',
+    re.IGNORECASE
+)
+JSON_PATH = re.compile(r"""\$\[['"](.+?)['"]\]|\$\.(\w+)""")
+# Rewrites that hold for every local dialect, applied in order.
+# Redshift only treats PRIMARY KEY as a planner hint, so the loads rely on it
+# not being enforced. Redshift also measures VARCHAR lengths in bytes rather
+# than characters, so lengths are dropped instead of risking rejected rows.
+LOCAL_REWRITES = [
+    (r'\s+PRIMARY KEY\b', ''),
+    (r'\s*\b(COMPOUND\s+|INTERLEAVED\s+)?SORTKEY\s*\([^)]*\)', ''),
+    (r'\s*\bDISTKEY\s*\([^)]*\)', ''),
+    (r'\s+(SORTKEY|DISTKEY)\b', ''),
+    (r'\s*\bDISTSTYLE\s+\w+', ''),
+    (r'\bVARCHAR\s*\(\s*\d+\s*\)', 'VARCHAR'),
+    (r"\btimestamp\s+'epoch'", "TIMESTAMP '1970-01-01 00:00:00'"),
+]
+
+
+def translate_query(query, dialect):
+    """Rewrite a Redshift statement for a local database.
+
+    Arguments:
+        query (str) - Redshift SQL statement, other than COPY
+        dialect (str) - one of DIALECTS
+
+    Returns:
+        statements (list) - SQL statements to run in place of the query
+    """
+    if dialect not in DIALECTS:
+        raise ValueError('Unknown dialect %s' % dialect)
+    statements = []
+    for pattern, replacement in LOCAL_REWRITES:
+        query = re.sub(pattern, replacement, query, flags=re.IGNORECASE)
+    identity = IDENTITY_COLUMN.search(query)
+    if identity and dialect == 'postgres':
+        query = IDENTITY_COLUMN.sub(
+            r'\g<column> \g<type> GENERATED BY DEFAULT AS IDENTITY '
+            r'(START WITH \g<seed> MINVALUE \g<seed> INCREMENT BY \g<step>)',
+            query
+        )
+    elif identity and dialect == 'duckdb':
+        # DuckDB has no identity columns, so back the column with a sequence.
+        sequence = '%s_%s_seq' % (
+            CREATE_TABLE.search(query).group(1), identity.group('column')
+        )
+        statements.append(
+            # DuckDB resets MINVALUE to 1 when INCREMENT BY follows it.
+            'CREATE OR REPLACE SEQUENCE {} INCREMENT BY {} MINVALUE {} '
+            'START {}'.format(
+                sequence, identity.group('step'), identity.group('seed'),
+                identity.group('seed')
+            )
+        )
+        query = IDENTITY_COLUMN.sub(
+            r"\g<column> \g<type> DEFAULT nextval('%s')" % sequence, query
+        )
+    if dialect == 'duckdb':
+        # DuckDB divides integers into doubles, which can't scale an interval.
+        query = re.sub(
+            r"TIMESTAMP '1970-01-01 00:00:00'\s*\+\s*(.+?)\s*\*\s*"
+            r"INTERVAL\s+'1 second'",
+            r'epoch_ms(CAST(FLOOR(\1) AS BIGINT) * 1000)',
+            query,
+            flags=re.IGNORECASE
+        )
+    statements.append(query)
+    return statements
+
+
+def local_path(uri, data_dir=DATA_DIR):
+    """Map an S3 URI onto the local data directory.
+
+    Arguments:
+        uri (str) - S3 URI such as s3://udacity-dend/log-data
+        data_dir (str) - local directory mirroring the bucket
+
+    Returns:
+        path (str) - local path for the URI
+    """
+    key = re.sub(r'^s3://[^/]+/?', '', uri.strip("'"))
+    return os.path.join(data_dir, key)
+
+
+def list_files(prefix):
+    """List local files the way S3 lists keys under a prefix.
+
+    Arguments:
+        prefix (str) - local path prefix
+
+    Returns:
+        paths (list) - sorted paths of files starting with the prefix
+    """
+    paths = []
+    root = prefix if os.path.isdir(prefix) else os.path.dirname(prefix)
+    for directory, _, file_names in os.walk(root):
+        for file_name in file_names:
+            path = os.path.join(directory, file_name)
+            if path.startswith(prefix):
+                paths.append(path)
+    return sorted(paths)
+
+
+def read_records(paths):
+    """Yield JSON records from files holding one or more JSON objects.
+
+    Arguments:
+        paths (list) - paths of JSON files
+
+    Returns:
+        records (generator) - one dict per JSON object
+    """
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def json_keys(cur, table, json_format, data_dir=DATA_DIR):
+    """Work out which JSON key feeds each column of the table, in order.
+
+    Arguments:
+        cur (cursor) - local database cursor
+        table (str) - table the COPY loads
+        json_format (str) - 'auto' or the S3 URI of a JSONPaths file
+        data_dir (str) - local directory mirroring the bucket
+
+    Returns:
+        keys (list) - JSON key for each table column
+    """
+    if json_format.lower() == 'auto':
+        cur.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_name = '{}' ORDER BY ordinal_position".format(table)
+        )
+        return [row[0].lower() for row in cur.fetchall()]
+    with open(local_path(json_format, data_dir)) as f:
+        json_paths = json.load(f)['jsonpaths']
+    return [
+        [key for key in JSON_PATH.match(path).groups() if key][0]
+        for path in json_paths
+    ]
+
+
+def csv_value(value):
+    """Format a JSON value for a CSV bulk load. Empty values load as NULL."""
+    if value is None or value == '':
+        return ''
+    # Redshift loads whole floats such as 1.54E12 into integer columns.
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def bulk_load(cur, query, dialect, data_dir=DATA_DIR):
+    """Run a Redshift S3 COPY as a bulk load of local JSON files.
+
+    Arguments:
+        cur (cursor) - local database cursor
+        query (str) - Redshift COPY statement
+        dialect (str) - one of DIALECTS
+        data_dir (str) - local directory mirroring the bucket
+    """
+    copy = COPY_STATEMENT.match(query)
+    table = copy.group('table')
+    keys = json_keys(cur, table, copy.group('json'), data_dir)
+    auto = copy.group('json').lower() == 'auto'
+    # Build the rows as CSV in table column order.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    paths = list_files(local_path(copy.group('source'), data_dir))
+    for record in read_records(paths):
+        if auto:
+            record = {k.lower(): v for k, v in record.items()}
+        writer.writerow([csv_value(record.get(key)) for key in keys])
+    print('Loading %d files into %s' % (len(paths), table))
+    buffer.seek(0)
+    if dialect == 'postgres':
+        cur.copy_expert(
+            'COPY {} FROM STDIN WITH (FORMAT csv)'.format(table), buffer
+        )
+    else:
+        # DuckDB reads CSV from a file path rather than a stream.
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write(buffer.getvalue())
+            f.flush()
+            cur.execute(
+                "COPY {} FROM '{}' (FORMAT csv, HEADER false)".format(
+                    table, f.name
+                )
+            )
+
+
+def unload(cur, query, dialect, data_dir=DATA_DIR):
+    """Run a Redshift Parquet UNLOAD as a local Parquet export.
+
+    Arguments:
+        cur (cursor) - local database cursor
+        query (str) - Redshift UNLOAD statement
+        dialect (str) - one of DIALECTS
+        data_dir (str) - local directory mirroring the bucket
+    """
+    if dialect != 'duckdb':
+        raise ValueError('Parquet UNLOAD is only supported locally by duckdb')
+    match = UNLOAD_STATEMENT.match(query)
+    select = translate_query(match.group('select').replace("''", "'"),
+                             dialect)[-1]
+    location = match.group('location')
+    if location.startswith('s3://'):
+        location = local_path(location, data_dir)
+    # Like CLEANPATH, replace any files left by an earlier unload.
+    shutil.rmtree(location, ignore_errors=True)
+    os.makedirs(location)
+    cur.execute("COPY ({}) TO '{}' (FORMAT parquet)".format(
+        select, os.path.join(location, '0000_part_00.parquet')
+    ))
+
+
+def execute_query(cur, query, dialect=None, data_dir=DATA_DIR):
+    """Execute a Redshift statement, translating it for a local dialect.
+
+    Arguments:
+        cur (cursor) - database cursor
+        query (str) - Redshift SQL statement
+        dialect (str) - one of DIALECTS, or None to run on Redshift as is
+        data_dir (str) - local directory mirroring the bucket
+    """
+    if dialect is None:
+        cur.execute(query)
+    elif COPY_STATEMENT.match(query):
+        bulk_load(cur, query, dialect, data_dir)
+    elif UNLOAD_STATEMENT.match(query):
+        unload(cur, query, dialect, data_dir)
+    else:
+        for statement in translate_query(query, dialect):
+            cur.execute(statement)
+
+
+def connect(dialect):
+    """Open a connection to the local database configured for a dialect.
+
+    Arguments:
+        dialect (str) - one of DIALECTS
+
+    Returns:
+        conn - database connection with cursor() and commit() methods
+    """
+    if dialect == 'postgres':
+        return psycopg2.connect(POSTGRES_DSN)
+    if dialect == 'duckdb':
+        # DuckDB is only needed for offline runs, so import it on demand.
+        import duckdb
+        return duckdb.connect(DUCKDB_PATH)
+    raise ValueError('Unknown dialect %s' % dialect)
@@ -0,0 +1,113 @@
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from infrastructure import create_session
+from sql_queries import (
+    LOG_DATA, SLIM_LOG_DATA, SLIM_LOG_JSON_PATH, STAGING_DATA,
+    slim_event_columns
+)
+
+
+def split_uri(uri):
+    """Split an S3 URI into its bucket and key.
+
+    Arguments:
+        uri (str) - S3 URI, optionally quoted as in dwh.cfg
+
+    Returns:
+        bucket (str) - bucket name
+        key (str) - object key or prefix
+    """
+    match = re.match(r's3://([^/]+)/?(.*)', uri.strip("'"))
+    if not match:
+        raise ValueError('Not an S3 URI: %r' % uri)
+    return match.group(1), match.group(2)
+
+
+def song_plays(body):
+    """Keep only the NextSong events of a log-data file.
+
+    Arguments:
+        body (str) - log-data file with one JSON event per line
+
+    Returns:
+        body (str) - the NextSong events, one per line
+    """
+    return '\n'.join(
+        line for line in body.splitlines()
+        if line.strip() and json.loads(line).get('page') == 'NextSong'
+    )
+
+
+def filter_log_data(s3_client, source=LOG_DATA, destination=SLIM_LOG_DATA,
+                    max_workers=8):
+    """Copy log-data to the staging bucket, keeping only NextSong events.
+
+    The raw data under source is left untouched. Files keep their path
+    relative to the prefix, so rerunning overwrites the earlier copy.
+
+    Arguments:
+        s3_client (boto3.client) - S3 client
+        source (str) - S3 URI of the raw log-data prefix
+        destination (str) - S3 URI of the filtered log-data prefix
+        max_workers (int) - number of files filtered at a time
+    """
+    source_bucket, source_prefix = split_uri(source)
+    destination_bucket, destination_prefix = split_uri(destination)
+    paginator = s3_client.get_paginator('list_objects_v2')
+    keys = [
+        item['Key']
+        for page in paginator.paginate(
+            Bucket=source_bucket, Prefix=source_prefix
+        )
+        for item in page.get('Contents', [])
+    ]
+
+    def filter_file(key):
+        body = s3_client.get_object(
+            Bucket=source_bucket, Key=key
+        )['Body'].read().decode('utf-8')
+        s3_client.put_object(
+            Bucket=destination_bucket,
+            Key=destination_prefix + key[len(source_prefix):],
+            Body=song_plays(body).encode('utf-8')
+        )
+
+    print('Filtering %d log-data files' % len(keys))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(filter_file, keys))
+
+
+def write_jsonpaths(s3_client, destination=SLIM_LOG_JSON_PATH):
+    """Write the JSONPaths file mapping log-data keys to the slim columns.
+
+    Arguments:
+        s3_client (boto3.client) - S3 client
+        destination (str) - S3 URI of the JSONPaths file
+    """
+    bucket, key = split_uri(destination)
+    json_paths = {
+        'jsonpaths': [
+            "$['%s']" % json_key for _, _, json_key in slim_event_columns
+        ]
+    }
+    s3_client.put_object(
+        Bucket=bucket, Key=key, Body=json.dumps(json_paths).encode('utf-8')
+    )
+
+
+def prepare_slim_staging():
+    """Filter log-data and write the JSONPaths file for slim staging."""
+    if not STAGING_DATA:
+        raise ValueError(
+            'Set STAGING_DATA in the [S3] section of dwh.cfg to the S3 URI '
+            'slim staging writes to'
+        )
+    session = create_session(
+        os.environ['DW_AWS_ACCESS_KEY_ID'],
+        os.environ['DW_AWS_SECRET_ACCESS_KEY']
+    )
+    s3_client = session.client('s3')
+    filter_log_data(s3_client)
+    write_jsonpaths(s3_client)
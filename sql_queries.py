@@ -10,6 +10,10 @@ IAM_ARN = config.get("IAM_ROLE", "ARN")
 SONG_DATA = config.get("S3", "SONG_DATA")
 LOG_DATA = config.get("S3", "LOG_DATA")
 LOG_JSON_PATH = config.get("S3", "LOG_JSON_PATH")
+STAGING_DATA = config.get("S3", "STAGING_DATA", fallback='').strip("'")
+SLIM_LOG_DATA = STAGING_DATA + '/log-data'
+SLIM_LOG_JSON_PATH = STAGING_DATA + '/slim_log_json_path.json'
+EXPORT_DATA = config.get("S3", "EXPORT_DATA", fallback='').strip("'")
 
 staging_events_table_drop = "DROP TABLE IF EXISTS staging_events"
 staging_songs_table_drop = "DROP TABLE IF EXISTS staging_songs"
@@ -187,22 +191,346 @@ time_table_insert = ("""
     FROM songplays
 """)
 
+# Slim staging loads only the staging_events columns read downstream into a
+# temp table, from a copy of log-data holding only NextSong events. Each
+# column is listed with the log-data JSON key it is loaded from. The COPY's
+# JSONPaths file is generated from this list, so it must match the table.
+slim_event_columns = [
+    ('artist', 'VARCHAR(100)', 'artist'),
+    ('firstName', 'VARCHAR(20)', 'firstName'),
+    ('gender', 'VARCHAR(1)', 'gender'),
+    ('lastName', 'VARCHAR(20)', 'lastName'),
+    ('level', 'VARCHAR(4)', 'level'),
+    ('location', 'VARCHAR(60)', 'location'),
+    ('page', 'VARCHAR(20)', 'page'),
+    ('session_id', 'INT', 'sessionId'),
+    ('song', 'VARCHAR(200)', 'song'),
+    ('ts', 'BIGINT', 'ts'),
+    ('userAgent', 'VARCHAR(200)', 'userAgent'),
+    ('userId', 'INT', 'userId')
+]
+
+# Temp tables take precedence over the permanent staging tables of the same
+# name, so the insert statements read from them unchanged.
+staging_events_slim_create = ("""
+    CREATE TEMP TABLE staging_events (
+        {}
+    );
+""").format(',\n        '.join(
+    '%s %s' % (column, column_type)
+    for column, column_type, _ in slim_event_columns
+))
+
+staging_songs_slim_create = ("""
+    CREATE TEMP TABLE staging_songs (
+        artist_id VARCHAR(30),
+        artist_latitude FLOAT,
+        artist_longitude FLOAT,
+        artist_location VARCHAR(200),
+        artist_name VARCHAR(200),
+        song_id VARCHAR(25),
+        title VARCHAR(200),
+        duration FLOAT,
+        year INT
+    );
+""")
+
+staging_events_slim_copy = ("""
+    COPY staging_events
+    FROM '{}'
+    IAM_ROLE {}
+    JSON '{}' maxerror as 250;
+""").format(SLIM_LOG_DATA, IAM_ARN, SLIM_LOG_JSON_PATH)
+
+# Backfill loads one year/month partition of log-data at a time into a temp
+# staging_events table, then replaces that month of songplays and time. The
+# month bounds are filled in with format(); start_ms and end_ms are epoch
+# milliseconds, start and end are timestamps.
+backfill_staging_events_create = ("""
+    CREATE TEMP TABLE staging_events (LIKE public.staging_events)
+""")
+
+backfill_staging_events_copy = ("""
+    COPY staging_events
+    FROM '{}/{{year}}/{{month:02d}}/'
+    IAM_ROLE {}
+    JSON {} maxerror as 250;
+""").format(LOG_DATA.strip("'"), IAM_ARN, LOG_JSON_PATH)
+
+# Concurrent partitions write to the same tables, and Redshift aborts all but
+# one of them with a serializable isolation error. Locking both tables after
+# the COPY makes the writes queue instead, without holding up the COPYs.
+backfill_partition_lock = "LOCK songplays, time"
+
+songplay_partition_delete = ("""
+    DELETE FROM songplays
+    WHERE start_time >= '{start}' AND start_time < '{end}'
+""")
+
+songplay_partition_insert = songplay_table_insert + (
+    "    AND e.ts >= {start_ms} AND e.ts < {end_ms}\n"
+)
+
+time_partition_delete = ("""
+    DELETE FROM time
+    WHERE start_time >= '{start}' AND start_time < '{end}'
+""")
+
+time_partition_insert = time_table_insert + (
+    "    WHERE start_time >= '{start}' AND start_time < '{end}'\n"
+)
+
+# The Parquet export rewrites only the year/month partitions whose
+# fingerprint changed since the last export. EXTRACT on start_time gives the
+# same year and month as the time table, without joining to it.
+export_partition_fingerprints = ("""
+    SELECT EXTRACT(year FROM start_time) AS year,
+        EXTRACT(month FROM start_time) AS month,
+        COUNT(*), MIN(songplay_id), MAX(songplay_id)
+    FROM songplays
+    GROUP BY 1, 2
+""")
+
+# Quotes are doubled since the select is a string literal inside UNLOAD.
+export_partition_select = (
+    "SELECT * FROM {table} "
+    "WHERE start_time >= ''{start}'' AND start_time < ''{end}''"
+)
+
+export_table_select = "SELECT * FROM {table}"
+
+export_unload = ("""
+    UNLOAD ('{{select}}')
+    TO '{{location}}'
+    IAM_ROLE {}
+    FORMAT AS PARQUET
+    CLEANPATH;
+""").format(IAM_ARN)
+
+# Batch loads only add the songs and artists not loaded before.
+song_table_insert_new = ("""
+    INSERT INTO songs(song_id, title, artist_id, year, duration)
+    SELECT s.song_id, s.title, s.artist_id, s.year, s.duration
+    FROM staging_songs s
+    WHERE NOT EXISTS (SELECT 1 FROM songs x WHERE x.song_id = s.song_id)
+""")
+
+artist_table_insert_new = artist_table_insert + (
+    "    WHERE NOT EXISTS (SELECT 1 FROM artists a "
+    "WHERE a.artist_id = s.artist_id)\n"
+)
+
+# Type 2 history of the users dimension. Each row is one version of a user,
+# valid from effective_from up to but not including effective_to.
+user_history_table_drop = "DROP TABLE IF EXISTS users_history"
+
+user_history_table_create = ("""
+    CREATE TABLE users_history (
+        user_id INT NOT NULL,
+        first_name VARCHAR(20),
+        last_name VARCHAR(20),
+        gender VARCHAR(1),
+        level VARCHAR(4),
+        effective_from TIMESTAMP NOT NULL,
+        effective_to TIMESTAMP NOT NULL,
+        is_current BOOLEAN NOT NULL
+    )
+    DISTSTYLE ALL
+    SORTKEY (user_id, effective_from);
+""")
+
+# Users with song plays in the batch in staging_events. Batch loads only
+# rebuild the history of these users.
+batch_users_select = (
+    "SELECT DISTINCT userId FROM staging_events "
+    "WHERE page = 'NextSong' AND userId IS NOT NULL"
+)
+
+# Versions starting after the batch, which rebuilding the batch's month would
+# lose. A batch is rejected while any of its users have one.
+user_history_later = ("""
+    SELECT COUNT(DISTINCT user_id)
+    FROM users_history
+    WHERE effective_from >= '{{end}}'
+    AND user_id IN ({0})
+""").format(batch_users_select)
+
+# Rebuild the batch's users from the start of the batch: drop their versions
+# from that point on and reopen the version they had before it.
+user_history_rewind = ("""
+    DELETE FROM users_history
+    WHERE effective_from >= '{{start}}'
+    AND user_id IN ({0})
+""").format(batch_users_select)
+
+user_history_reopen = ("""
+    UPDATE users_history
+    SET effective_to = timestamp '9999-12-31 00:00:00', is_current = TRUE
+    WHERE effective_to >= '{{start}}'
+    AND user_id IN ({0})
+""").format(batch_users_select)
+
+# New versions from the batch: the first play whose level differs from the
+# version before the batch, then every later level change. Only users in the
+# batch are joined to history, so the cost follows the batch size rather
+# than the whole event history.
+user_versions_create = ("""
+    CREATE TEMP TABLE user_versions AS
+    SELECT user_id, first_name, last_name, gender, level, effective_from
+    FROM (
+        SELECT e.userId AS user_id, e.firstName AS first_name,
+            e.lastName AS last_name, e.gender, e.level,
+            (timestamp 'epoch' + e.ts/1000 *INTERVAL '1 second')
+                AS effective_from,
+            COALESCE(
+                LAG(e.level) OVER (PARTITION BY e.userId ORDER BY e.ts),
+                h.level
+            ) AS previous_level
+        FROM staging_events e
+        LEFT JOIN users_history h
+        ON (e.userId = h.user_id AND h.is_current)
+        WHERE e.page = 'NextSong'
+        AND e.userId IS NOT NULL
+    ) v
+    WHERE previous_level IS NULL OR previous_level <> level
+""")
+
+user_history_close = ("""
+    UPDATE users_history
+    SET effective_to = v.first_from, is_current = FALSE
+    FROM (SELECT user_id, MIN(effective_from) AS first_from
+          FROM user_versions
+          GROUP BY user_id) v
+    WHERE users_history.user_id = v.user_id AND users_history.is_current
+""")
+
+user_history_insert = ("""
+    INSERT INTO users_history(user_id, first_name, last_name, gender, level,
+        effective_from, effective_to, is_current)
+    SELECT user_id, first_name, last_name, gender, level, effective_from,
+        COALESCE(
+            LEAD(effective_from) OVER (PARTITION BY user_id
+                                       ORDER BY effective_from),
+            timestamp '9999-12-31 00:00:00'
+        ) AS effective_to,
+        LEAD(effective_from) OVER (PARTITION BY user_id
+                                   ORDER BY effective_from) IS NULL
+            AS is_current
+    FROM user_versions
+""")
+
+# Refresh the current users dimension for the users in the batch.
+user_current_delete = ("""
+    DELETE FROM users
+    WHERE user_id IN ({0})
+""").format(batch_users_select)
+
+user_current_insert = ("""
+    INSERT INTO users(user_id, first_name, last_name, gender, level)
+    SELECT user_id, first_name, last_name, gender, level
+    FROM users_history
+    WHERE is_current
+    AND user_id IN ({0})
+""").format(batch_users_select)
+
+user_versions_drop = "DROP TABLE user_versions"
+
+# Users who converted from the free to the paid level, and when.
+user_conversions_select = ("""
+    SELECT p.user_id, p.effective_from AS converted_at
+    FROM users_history f
+    INNER JOIN users_history p
+    ON (f.user_id = p.user_id AND f.effective_to = p.effective_from)
+    WHERE f.level = 'free' AND p.level = 'paid'
+""")
+
+# Range join attributing each song play to the user's level at play time.
+songplays_by_level_select = ("""
+    SELECT h.level, COUNT(*) AS songplays
+    FROM songplays sp
+    INNER JOIN users_history h
+    ON (sp.user_id = h.user_id
+        AND sp.start_time >= h.effective_from
+        AND sp.start_time < h.effective_to)
+    GROUP BY h.level
+""")
+
 
 create_table_queries = [
     staging_events_table_create, staging_songs_table_create,
     songplay_table_create, user_table_create, song_table_create,
-    artist_table_create, time_table_create
+    artist_table_create, time_table_create, user_history_table_create
 ]
 
 drop_table_queries = [
     staging_events_table_drop, staging_songs_table_drop,
     songplay_table_drop, user_table_drop, song_table_drop, artist_table_drop,
-    time_table_drop
+    time_table_drop, user_history_table_drop
 ]
 
 copy_table_queries = [staging_events_copy, staging_songs_copy]
 
+# Empty the staging tables before a reload. DELETE rather than TRUNCATE, since
+# TRUNCATE commits the open transaction on Redshift.
+staging_events_clear = "DELETE FROM staging_events"
+staging_songs_clear = "DELETE FROM staging_songs"
+
+clear_staging_queries = [staging_events_clear, staging_songs_clear]
+
+# JSON 'auto' skips the num_songs key missing from the slim staging_songs.
+slim_copy_table_queries = [
+    staging_events_slim_create, staging_songs_slim_create,
+    staging_events_slim_copy, staging_songs_copy
+]
+
 insert_table_queries = [
     songplay_table_insert, user_table_insert, song_table_insert,
     artist_table_insert, time_table_insert
 ]
+
+backfill_partition_queries = [
+    songplay_partition_delete, songplay_partition_insert,
+    time_partition_delete, time_partition_insert
+]
+
+user_history_queries = [
+    user_history_rewind, user_history_reopen, user_versions_create,
+    user_history_close, user_history_insert, user_current_delete,
+    user_current_insert, user_versions_drop
+]
+
+# Loads one year/month batch of log-data, keeping type 2 history for users.
+# Every statement is formatted with the batch bounds, as for the backfill.
+# The whole batch is replaced when it is loaded again, and user_history_later
+# is checked between the two lists to reject batches older than the history.
+scd_staging_queries = clear_staging_queries + [
+    backfill_staging_events_copy, staging_songs_copy
+]
+
+scd_load_queries = backfill_partition_queries + [
+    song_table_insert_new, artist_table_insert_new
+] + user_history_queries
+
+# Queries backing BI dashboards, keyed by name. The EXPLAIN plan harness in
+# explain_plans.py tracks these alongside the insert statements.
+dashboard_queries = {
+    'user_conversions_select': user_conversions_select,
+    'songplays_by_level_select': songplays_by_level_select
+}
+
+# Shadow tables let a load build the star schema out of sight of readers and
+# swap it in with a single commit.
+star_schema_tables = ['songplays', 'users', 'songs', 'artists', 'time']
+
+shadow_table_drop = "DROP TABLE IF EXISTS {0}_shadow"
+shadow_table_create = "CREATE TABLE {0}_shadow (LIKE {0} INCLUDING DEFAULTS)"
+# Dropping a live table drops its grants, so they are read from the catalog
+# and granted again on the shadow table before the swap.
+shadow_table_acl = (
+    "SELECT relacl FROM pg_class WHERE relname = '{0}' AND relkind = 'r'"
+)
+shadow_table_grant = "GRANT {privileges} ON {table}_shadow TO {grantee}"
+shadow_table_swap = ("""
+    DROP TABLE {0};
+    ALTER TABLE {0}_shadow RENAME TO {0};
+""")
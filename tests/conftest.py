@@ -0,0 +1,66 @@
+import configparser
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, 'tests', 'data')
+sys.path.insert(0, ROOT)
+
+# Every module reads dwh.cfg from a fixed path when it is imported, so point
+# those reads at a test config before any of them is imported.
+TEST_CONFIG = os.path.join(tempfile.mkdtemp(), 'dwh.cfg')
+with open(TEST_CONFIG, 'w') as f:
+    f.write("""[CLUSTER]
+HOST='localhost'
+IDENTIFIER=redJamCluster
+DBNAME=red_jam
+USER=red_jam_user
+PASSWORD=password
+PORT=5439
+CLUSTER_TYPE=multi-node
+NUM_NODES=4
+NODE_TYPE=dc2.large
+IAM_ROLE_NAME=redJamRole
+[IAM_ROLE]
+ARN='arn:aws:iam::000000000000:role/redJamRole'
+[S3]
+LOG_DATA='s3://udacity-dend/log-data'
+LOG_JSON_PATH='s3://udacity-dend/log_json_path.json'
+SONG_DATA='s3://udacity-dend/song-data'
+STAGING_DATA='s3://red-jam-staging'
+EXPORT_DATA='s3://red-jam-export'
+[LOCAL]
+DATA_DIR={}
+DUCKDB_PATH=red_jam.duckdb
+""".format(DATA_DIR))
+
+_read = configparser.ConfigParser.read
+
+
+def _read_test_config(self, filenames, encoding=None):
+    return _read(self, TEST_CONFIG, encoding)
+
+
+configparser.ConfigParser.read = _read_test_config
+
+
+@pytest.fixture
+def duckdb_path(tmp_path, monkeypatch):
+    """Point the DuckDB dialect at a fresh database file."""
+    import local_dialect
+    path = str(tmp_path / 'red_jam.duckdb')
+    monkeypatch.setattr(local_dialect, 'DUCKDB_PATH', path)
+    return path
+
+
+def query(path, sql):
+    """Run a query against a DuckDB database file and return its rows."""
+    import duckdb
+    conn = duckdb.connect(path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
@@ -0,0 +1,96 @@
+from unittest import mock
+
+import psycopg2
+import pytest
+
+import backfill
+
+CONFLICT = psycopg2.Error(
+    'ERROR: 1023 DETAIL: Serializable isolation violation on table songplays'
+)
+
+
+def test_month_partitions_cross_a_year_boundary():
+    assert backfill.month_partitions('2018-11', '2019-02') == [
+        (2018, 11), (2018, 12), (2019, 1), (2019, 2)
+    ]
+    assert backfill.month_partitions('2018-11', '2018-11') == [(2018, 11)]
+    assert backfill.month_partitions('2018-12', '2018-11') == []
+
+
+def test_partition_bounds():
+    assert backfill.partition_bounds(2018, 12) == {
+        'year': 2018,
+        'month': 12,
+        'start': '2018-12-01 00:00:00',
+        'end': '2019-01-01 00:00:00',
+        'start_ms': 1543622400000,
+        'end_ms': 1546300800000
+    }
+    assert backfill.partition_bounds(2020, 2)['end'] == '2020-03-01 00:00:00'
+
+
+def test_backfill_partition_locks_after_copy():
+    conn = mock.MagicMock()
+    conn.cursor().rowcount = 7
+
+    assert backfill.backfill_partition(conn, 2018, 11) == 7
+
+    statements = [
+        call.args[0].strip() for call in conn.cursor().execute.call_args_list
+    ]
+    assert statements[1].startswith('COPY staging_events')
+    assert "'s3://udacity-dend/log-data/2018/11/'" in statements[1]
+    assert statements[2] == 'LOCK songplays, time'
+    assert statements[3].startswith('DELETE FROM songplays')
+    conn.commit.assert_called_once()
+
+
+def test_run_partition_retries_serialization_conflicts():
+    conns = [mock.MagicMock(), mock.MagicMock()]
+    conns[0].cursor().execute.side_effect = [None, None, None, CONFLICT]
+    conns[1].cursor().rowcount = 4
+    with mock.patch('backfill.psycopg2.connect', side_effect=conns):
+        rows, _ = backfill.run_partition(2018, 11)
+
+    assert rows == 4
+    conns[0].rollback.assert_called_once()
+    for conn in conns:
+        conn.close.assert_called_once()
+    conns[1].commit.assert_called_once()
+
+
+def test_run_partition_gives_up_after_retries():
+    conns = [mock.MagicMock() for _ in range(3)]
+    for conn in conns:
+        conn.cursor().execute.side_effect = CONFLICT
+    with mock.patch('backfill.psycopg2.connect', side_effect=conns):
+        with pytest.raises(psycopg2.Error):
+            backfill.run_partition(2018, 11, retries=2)
+
+    for conn in conns:
+        conn.close.assert_called_once()
+
+
+def test_run_partition_raises_other_errors():
+    conn = mock.MagicMock()
+    conn.cursor().execute.side_effect = psycopg2.Error('S3 access denied')
+    with mock.patch('backfill.psycopg2.connect', return_value=conn) as connect:
+        with pytest.raises(psycopg2.Error, match='S3 access denied'):
+            backfill.run_partition(2018, 11)
+
+    assert connect.call_count == 1
+    conn.rollback.assert_called_once()
+    conn.close.assert_called_once()
+
+
+def test_backfill_pipeline_returns_failed_partitions():
+    def run_partition(year, month):
+        if month == 12:
+            raise psycopg2.Error('S3 access denied')
+        return 10, 1.0
+
+    with mock.patch('backfill.run_partition', side_effect=run_partition):
+        failed = backfill.backfill_pipeline('2018-10', '2019-01')
+
+    assert failed == [(2018, 12)]
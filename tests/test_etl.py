@@ -0,0 +1,127 @@
+from unittest import mock
+
+import pytest
+
+import etl
+
+
+def test_atomic_load_clears_staging_and_commits_once():
+    conn = mock.MagicMock()
+    conn.cursor().fetchone.return_value = (None,)
+    with mock.patch('etl.psycopg2.connect', return_value=conn):
+        etl.etl_atomic_load_pipeline()
+
+    statements = [
+        call.args[0].strip() for call in conn.cursor().execute.call_args_list
+    ]
+    assert statements[:2] == [
+        'DELETE FROM staging_events', 'DELETE FROM staging_songs'
+    ]
+    assert statements[2].startswith('COPY staging_events')
+    assert not any(s.upper().startswith('TRUNCATE') for s in statements)
+    assert statements[-1].startswith('DROP TABLE time;')
+    conn.commit.assert_called_once_with()
+
+
+def test_atomic_load_keeps_grants_on_swapped_tables():
+    conn = mock.MagicMock()
+    conn.cursor().fetchone.return_value = (
+        '{brent=arwdRxtD/brent,"group dashboards=r/brent",'
+        'analyst=rw*/brent,=r/brent}',
+    )
+    with mock.patch('etl.psycopg2.connect', return_value=conn):
+        etl.etl_atomic_load_pipeline()
+
+    statements = [
+        call.args[0].strip() for call in conn.cursor().execute.call_args_list
+    ]
+    grants = [
+        'GRANT SELECT ON users_shadow TO GROUP dashboards',
+        'GRANT SELECT, UPDATE ON users_shadow TO analyst',
+        'GRANT SELECT ON users_shadow TO PUBLIC'
+    ]
+    assert [s for s in statements if 'ON users_shadow' in s] == grants
+    swap = [i for i, s in enumerate(statements)
+            if s.startswith('DROP TABLE users;')][0]
+    assert all(statements.index(grant) < swap for grant in grants)
+    conn.commit.assert_called_once_with()
+
+
+def test_scd_batches_load_incrementally(duckdb_path):
+    import datetime
+    from conftest import query
+    import create_tables
+
+    create_tables.create_tables_pipeline('duckdb')
+    etl.etl_scd_load_pipeline('2018-11', 'duckdb')
+    etl.etl_scd_load_pipeline('2018-12', 'duckdb')
+    # Loading a batch again replaces it.
+    etl.etl_scd_load_pipeline('2018-12', 'duckdb')
+
+    assert query(duckdb_path, 'SELECT COUNT(*) FROM staging_events') == [(3,)]
+    assert query(duckdb_path, 'SELECT COUNT(*) FROM songplays') == [(7,)]
+    assert query(
+        duckdb_path,
+        'SELECT COUNT(*) FROM (SELECT DISTINCT user_id, start_time '
+        'FROM songplays)'
+    ) == [(7,)]
+    assert query(duckdb_path, 'SELECT COUNT(*) FROM time') == [(7,)]
+    assert query(duckdb_path, 'SELECT COUNT(*) FROM songs') == [(3,)]
+    assert query(duckdb_path, 'SELECT COUNT(*) FROM artists') == [(2,)]
+
+    nov = datetime.datetime(2018, 11, 1)
+    dec = datetime.datetime(2018, 12, 1)
+    second = datetime.timedelta(seconds=1)
+    end = datetime.datetime(9999, 12, 31)
+    assert query(
+        duckdb_path,
+        'SELECT user_id, level, effective_from, effective_to, is_current '
+        'FROM users_history ORDER BY user_id, effective_from'
+    ) == [
+        (10, 'free', nov + second, nov + 3 * second, False),
+        (10, 'paid', nov + 3 * second, end, True),
+        (20, 'free', nov + 4 * second, dec + 2 * second, False),
+        (20, 'paid', dec + 2 * second, end, True),
+        (30, 'paid', nov + 6 * second, end, True),
+    ]
+    assert query(
+        duckdb_path, 'SELECT user_id, level FROM users ORDER BY user_id'
+    ) == [(10, 'paid'), (20, 'paid'), (30, 'paid')]
+
+
+def test_scd_rejects_batch_older_than_history(duckdb_path):
+    from conftest import query
+    import create_tables
+
+    create_tables.create_tables_pipeline('duckdb')
+    etl.etl_scd_load_pipeline('2018-12', 'duckdb')
+    history = 'SELECT * FROM users_history ORDER BY user_id, effective_from'
+    before = query(duckdb_path, history)
+
+    with pytest.raises(ValueError, match='load the months in order'):
+        etl.etl_scd_load_pipeline('2018-11', 'duckdb')
+
+    # Nothing from the rejected batch is kept.
+    assert query(duckdb_path, history) == before
+    assert query(
+        duckdb_path,
+        "SELECT COUNT(*) FROM songplays WHERE start_time < '2018-12-01'"
+    ) == [(0,)]
+
+
+def test_scd_reloading_a_month_rebuilds_its_history(duckdb_path):
+    from conftest import query
+    import create_tables
+
+    create_tables.create_tables_pipeline('duckdb')
+    etl.etl_scd_load_pipeline('2018-11', 'duckdb')
+    history = (
+        'SELECT user_id, level, effective_from, effective_to, is_current '
+        'FROM users_history ORDER BY user_id, effective_from'
+    )
+    before = query(duckdb_path, history)
+    # No later month is loaded, so November can be loaded again.
+    etl.etl_scd_load_pipeline('2018-11', 'duckdb')
+
+    assert query(duckdb_path, history) == before
+    assert query(duckdb_path, 'SELECT COUNT(*) FROM songplays') == [(4,)]
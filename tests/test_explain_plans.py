@@ -0,0 +1,85 @@
+import os
+import shutil
+
+import pytest
+
+import explain_plans
+
+BROADCAST_PLAN = """\
+XN Hash Join DS_BCAST_INNER  (cost=1.84..7504183.20 rows=6820 width=1126)
+  Hash Cond: (("outer".song)::text = ("inner".title)::text)
+  ->  XN Seq Scan on staging_events e  (cost=0.00..100.95 rows=6820 width=926)
+        Filter: ((page)::text = 'NextSong'::text)
+  ->  XN Hash  (cost=1.47..1.47 rows=147 width=468)
+        ->  XN Seq Scan on staging_songs  (cost=0.00..1.47 rows=147 width=468)
+"""
+
+REDISTRIBUTE_PLAN = BROADCAST_PLAN.replace('DS_BCAST_INNER', 'DS_DIST_BOTH')
+
+
+def test_parse_plan_reads_root_cost_and_joins():
+    summary = explain_plans.parse_plan(BROADCAST_PLAN)
+
+    assert summary == {
+        'cost': 7504183.20,
+        'rows': 6820,
+        'joins': [('Hash Join', 'DS_BCAST_INNER')]
+    }
+
+
+def test_parse_plan_rejects_text_without_plan_nodes():
+    with pytest.raises(ValueError):
+        explain_plans.parse_plan('ERROR:  relation "songplays" does not exist')
+
+
+def test_compare_plans_flags_new_redistribution():
+    regressions = explain_plans.compare_plans(
+        BROADCAST_PLAN, REDISTRIBUTE_PLAN
+    )
+
+    assert regressions == ['DS_DIST_BOTH joins went from 0 to 1']
+
+
+@pytest.mark.parametrize('strategy', ['DS_DIST_INNER', 'DS_DIST_OUTER'])
+def test_compare_plans_flags_single_side_redistribution(strategy):
+    with open(os.path.join(
+        explain_plans.BASELINE_DIR, 'users_insert.txt'
+    )) as f:
+        baseline = f.read()
+    recorded = baseline.replace('DS_DIST_NONE', strategy)
+
+    assert explain_plans.compare_plans(baseline, recorded) == [
+        '%s joins went from 0 to 1' % strategy
+    ]
+
+
+def test_compare_plans_allows_cost_within_tolerance():
+    within = BROADCAST_PLAN.replace('7504183.20', '8254601.52')
+    beyond = BROADCAST_PLAN.replace('7504183.20', '8254601.53')
+
+    assert explain_plans.compare_plans(BROADCAST_PLAN, within, 0.10) == []
+    assert explain_plans.compare_plans(BROADCAST_PLAN, beyond, 0.10) == [
+        'cost went from 7504183.20 to 8254601.53'
+    ]
+
+
+def test_committed_baselines_cover_tracked_queries():
+    assert explain_plans.check_plans() == {}
+
+
+def test_check_plans_fails_on_missing_and_unparsable_plans(tmp_path):
+    baseline_dir = str(tmp_path / 'baseline')
+    recorded_dir = str(tmp_path / 'recorded')
+    shutil.copytree(explain_plans.BASELINE_DIR, baseline_dir)
+    shutil.copytree(explain_plans.RECORDED_DIR, recorded_dir)
+    (tmp_path / 'baseline' / 'songs_insert.txt').unlink()
+    (tmp_path / 'recorded' / 'time_insert.txt').unlink()
+    (tmp_path / 'recorded' / 'users_insert.txt').write_text('')
+
+    report = explain_plans.check_plans(baseline_dir, recorded_dir)
+
+    assert report == {
+        'songs_insert': ['no baseline plan'],
+        'time_insert': ['no recorded plan'],
+        'users_insert': ['unparsable plan: no plan nodes found']
+    }
@@ -0,0 +1,90 @@
+import json
+import os
+
+import pytest
+from conftest import query
+
+import create_tables
+import etl
+import export
+
+PARTITIONS = [
+    'songplays/year=2018/month=11', 'songplays/year=2018/month=12',
+    'time/year=2018/month=11', 'time/year=2018/month=12'
+]
+
+
+@pytest.fixture
+def warehouse(duckdb_path):
+    """Load the fixture data into a fresh DuckDB warehouse."""
+    create_tables.create_tables_pipeline('duckdb')
+    etl.etl_initial_load_pipeline('duckdb')
+    return duckdb_path
+
+
+def run(path, sql):
+    import duckdb
+    conn = duckdb.connect(path)
+    try:
+        conn.execute(sql)
+    finally:
+        conn.close()
+
+
+def export_times(store):
+    manifest = json.loads(store.read(export.MANIFEST_KEY))
+    return {
+        key: entry['exported_at']
+        for key, entry in manifest['partitions'].items()
+        if '/' in key
+    }
+
+
+def test_export_rewrites_only_changed_partitions(warehouse, tmp_path):
+    store = export.LocalStore(str(tmp_path / 'export'))
+
+    # The first export writes every partition and table.
+    assert export.export_pipeline(store, 'duckdb') == []
+    first = export_times(store)
+    assert sorted(first) == PARTITIONS
+    for key in PARTITIONS + ['users', 'songs', 'artists']:
+        assert os.listdir(store.uri(key)) == ['0000_part_00.parquet']
+    assert query(warehouse, "SELECT COUNT(*) FROM '%s'" % os.path.join(
+        store.uri('songplays/year=2018/month=11'), '*.parquet'
+    )) == [(4,)]
+
+    # Rerunning without changes leaves every partition alone.
+    assert export.export_pipeline(store, 'duckdb') == []
+    assert export_times(store) == first
+
+    # Changing a month rewrites only that month.
+    run(warehouse, "DELETE FROM songplays WHERE start_time >= '2018-12-01' "
+                   "AND user_id = 10")
+    assert export.export_pipeline(store, 'duckdb') == []
+    changed = export_times(store)
+    for key in PARTITIONS:
+        if 'month=12' in key:
+            assert changed[key] != first[key]
+        else:
+            assert changed[key] == first[key]
+    assert query(warehouse, "SELECT COUNT(*) FROM '%s'" % os.path.join(
+        store.uri('songplays/year=2018/month=12'), '*.parquet'
+    )) == [(2,)]
+
+    # A month gone from the warehouse is removed from the store and manifest.
+    run(warehouse, "DELETE FROM songplays WHERE start_time < '2018-12-01'")
+    assert export.export_pipeline(store, 'duckdb') == []
+    assert sorted(export_times(store)) == [
+        'songplays/year=2018/month=12', 'time/year=2018/month=12'
+    ]
+    assert not os.path.exists(store.uri('songplays/year=2018/month=11'))
+    assert not os.path.exists(store.uri('time/year=2018/month=11'))
+
+
+def test_export_reports_failed_unloads(warehouse, tmp_path, monkeypatch):
+    store = export.LocalStore(str(tmp_path / 'export'))
+    monkeypatch.setattr(export, 'DIMENSION_TABLES', ['users', 'missing'])
+
+    assert export.export_pipeline(store, 'duckdb') == ['missing']
+    manifest = json.loads(store.read(export.MANIFEST_KEY))
+    assert 'missing' not in manifest['partitions']
@@ -0,0 +1,160 @@
+import threading
+from unittest import mock
+
+import pytest
+from botocore.exceptions import ClientError
+
+import fleet
+import infrastructure
+
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'Describe')
+
+
+class FakeRedshift:
+    """Redshift client whose clusters step through a list of statuses.
+
+    Each describe_clusters call returns the next status for the cluster and
+    then keeps returning the last one. A status of None means the cluster is
+    gone, and an exception is raised as is.
+    """
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _call(self, method, identifier):
+        with self.lock:
+            self.calls.append((method, identifier))
+
+    def create_cluster(self, **kwargs):
+        self._call('create', kwargs['ClusterIdentifier'])
+
+    def pause_cluster(self, ClusterIdentifier):
+        self._call('pause', ClusterIdentifier)
+
+    def resume_cluster(self, ClusterIdentifier):
+        self._call('resume', ClusterIdentifier)
+
+    def delete_cluster(self, ClusterIdentifier, SkipFinalClusterSnapshot):
+        self._call('delete', ClusterIdentifier)
+
+    def describe_clusters(self, ClusterIdentifier):
+        with self.lock:
+            statuses = self.statuses[ClusterIdentifier]
+            status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        if status is None:
+            raise client_error('ClusterNotFound')
+        if isinstance(status, Exception):
+            raise status
+        return {'Clusters': [{
+            'ClusterIdentifier': ClusterIdentifier,
+            'ClusterStatus': status,
+            'VpcId': 'vpc-%s' % ClusterIdentifier,
+            'Endpoint': {'Address': '%s.redshift.amazonaws.com'
+                         % ClusterIdentifier}
+        }]}
+
+
+def fake_session(redshift_client):
+    session = mock.MagicMock()
+    iam_client = mock.MagicMock()
+    iam_client.get_role.return_value = {'Role': {'Arn': 'arn:role'}}
+    session.client.side_effect = lambda name: {
+        'iam': iam_client, 'redshift': redshift_client
+    }[name]
+    return session
+
+
+def test_wait_for_cluster_backs_off_up_to_max_delay():
+    redshift = FakeRedshift({
+        'cluster': ['creating'] * 6 + ['available']
+    })
+    sleeps = []
+
+    properties = infrastructure.wait_for_cluster(
+        redshift, 'available', 'cluster', sleep=sleeps.append
+    )
+
+    assert properties['ClusterStatus'] == 'available'
+    assert sleeps == [5, 10, 20, 40, 60, 60]
+
+
+def test_wait_for_cluster_times_out():
+    redshift = FakeRedshift({'cluster': ['creating']})
+    sleeps = []
+
+    with pytest.raises(TimeoutError):
+        infrastructure.wait_for_cluster(
+            redshift, 'available', 'cluster', timeout=30,
+            sleep=sleeps.append
+        )
+    assert sleeps == [5, 10, 20]
+
+
+def test_run_fleet_builds_pauses_and_deletes_environments():
+    names = ['test1', 'test2', 'test3']
+    identifiers = [fleet.environment_identifier(name) for name in names]
+    redshift = FakeRedshift({
+        identifier: ['creating', 'available', 'pausing', 'paused',
+                     'deleting', None]
+        for identifier in identifiers
+    })
+    session = fake_session(redshift)
+    sleeps = []
+
+    built = fleet.run_fleet('build', names, session, sleep=sleeps.append)
+    paused = fleet.run_fleet('pause', names, session, sleep=sleeps.append)
+    deleted = fleet.run_fleet('delete', names, session, sleep=sleeps.append)
+
+    assert identifiers == [
+        'redjamcluster-test1', 'redjamcluster-test2', 'redjamcluster-test3'
+    ]
+    assert {name: p['ClusterStatus'] for name, p in built.items()} == {
+        name: 'available' for name in names
+    }
+    assert {name: p['ClusterStatus'] for name, p in paused.items()} == {
+        name: 'paused' for name in names
+    }
+    # A cluster that is no longer found has been deleted.
+    assert deleted == {name: None for name in names}
+    assert sorted(redshift.calls) == sorted(
+        (method, identifier)
+        for method in ['create', 'pause', 'delete']
+        for identifier in identifiers
+    )
+    # Every wait polled twice, so slept once at the first delay.
+    assert sleeps == [5] * 9
+
+
+def test_run_fleet_keeps_going_when_one_environment_fails():
+    names = ['test1', 'test2']
+    denied = client_error('AccessDenied')
+    redshift = FakeRedshift({
+        fleet.environment_identifier('test1'): [denied],
+        fleet.environment_identifier('test2'): ['pausing', 'paused']
+    })
+
+    results = fleet.run_fleet(
+        'pause', names, fake_session(redshift), sleep=lambda seconds: None
+    )
+
+    assert results['test1'] is denied
+    assert results['test2']['ClusterStatus'] == 'paused'
+
+
+def test_report_fleet_prints_hosts_and_lists_failures(capsys):
+    results = {
+        'test2': {'Endpoint': {'Address': 'test2.redshift.amazonaws.com'}},
+        'test1': client_error('InsufficientClusterCapacity'),
+        'test3': {'Endpoint': {'Address': 'test3.redshift.amazonaws.com'}}
+    }
+
+    assert fleet.report_fleet('build', results) == ['test1']
+    assert capsys.readouterr().out.splitlines() == [
+        'test2 HOST: test2.redshift.amazonaws.com',
+        'test3 HOST: test3.redshift.amazonaws.com'
+    ]
+    assert fleet.report_fleet('delete', {'test1': None}) == []
@@ -0,0 +1,48 @@
+from conftest import query
+
+import create_tables
+import etl
+from local_dialect import translate_query
+
+
+def test_translate_removes_redshift_table_attributes():
+    statement = translate_query(
+        'CREATE TABLE t (id INT PRIMARY KEY DISTKEY, name VARCHAR(20))\n'
+        'DISTSTYLE ALL\nSORTKEY (id);',
+        'postgres'
+    )[-1]
+    assert statement == 'CREATE TABLE t (id INT, name VARCHAR);'
+
+
+def test_duckdb_identity_becomes_sequence_starting_at_seed():
+    statements = translate_query(
+        'CREATE TABLE t (t_id BIGINT IDENTITY(0,1) PRIMARY KEY)', 'duckdb'
+    )
+    assert statements[0] == (
+        'CREATE OR REPLACE SEQUENCE t_t_id_seq INCREMENT BY 1 MINVALUE 0 '
+        'START 0'
+    )
+    assert "DEFAULT nextval('t_t_id_seq')" in statements[1]
+
+
+def test_duckdb_pipelines_run_end_to_end(duckdb_path):
+    create_tables.create_tables_pipeline('duckdb')
+    etl.etl_initial_load_pipeline('duckdb')
+
+    assert query(duckdb_path, 'SELECT COUNT(*) FROM staging_events') == [(9,)]
+    assert query(duckdb_path, 'SELECT COUNT(*) FROM staging_songs') == [(3,)]
+    # Every NextSong event except the one for an unknown song.
+    assert query(duckdb_path, 'SELECT COUNT(*) FROM songplays') == [(7,)]
+    assert query(
+        duckdb_path, 'SELECT MIN(songplay_id), MAX(songplay_id) FROM songplays'
+    ) == [(0, 6)]
+    assert query(
+        duckdb_path,
+        "SELECT start_time FROM songplays WHERE user_id = 20 "
+        "ORDER BY start_time LIMIT 1"
+    )[0][0].isoformat() == '2018-11-01T00:00:04'
+    assert query(
+        duckdb_path, 'SELECT user_id, level FROM users ORDER BY user_id'
+    ) == [(10, 'paid'), (20, 'paid'), (30, 'paid')]
+    assert query(duckdb_path, 'SELECT COUNT(*) FROM songs') == [(3,)]
+    assert query(duckdb_path, 'SELECT COUNT(*) FROM time') == [(7,)]
@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+import slim_staging
+
+
+def test_song_plays_keeps_only_next_song_events():
+    body = '\n'.join(json.dumps(event) for event in [
+        {'page': 'NextSong', 'song': 'Song A'},
+        {'page': 'Home'},
+        {'page': 'NextSong', 'song': 'Song B'},
+    ])
+
+    assert [
+        json.loads(line)['song']
+        for line in slim_staging.song_plays(body).splitlines()
+    ] == ['Song A', 'Song B']
+
+
+def test_split_uri_rejects_non_s3_uri():
+    assert slim_staging.split_uri("'s3://bucket/log-data'") == (
+        'bucket', 'log-data'
+    )
+    with pytest.raises(ValueError):
+        slim_staging.split_uri('/log-data')
+
+
+def test_prepare_slim_staging_needs_staging_data(monkeypatch):
+    monkeypatch.setattr(slim_staging, 'STAGING_DATA', '')
+
+    with pytest.raises(ValueError, match='STAGING_DATA'):
+        slim_staging.prepare_slim_staging()
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+import top_plays
+
+NOV = 1541030400000
+
+
+def test_top_plays_ranks_songs_and_artists_from_log_data():
+    path = os.path.join(
+        os.path.dirname(__file__), 'data', 'log-data', '2018', '11',
+        '2018-11-01-events.json'
+    )
+    plays = top_plays.TopPlays(window_seconds=3600)
+    with open(path) as f:
+        top_plays.consume(f, plays)
+
+    assert plays.top_songs(1) == [('Song A', 'Artist A', 2)]
+    assert plays.top_artists(1) == [('Artist A', 3)]
+
+
+def test_song_without_artist_is_keyed_by_song_alone():
+    plays = top_plays.TopPlays()
+    plays.add_event({'page': 'NextSong', 'song': 'Song A', 'ts': NOV})
+
+    assert plays.top_songs() == [('Song A', '', 1)]
+    assert plays.top_artists() == []
+
+
+def test_top_needs_at_least_one_window():
+    plays = top_plays.TopPlays()
+    plays.add_event({
+        'page': 'NextSong', 'song': 'Song A', 'artist': 'Artist A',
+        'ts': NOV
+    })
+
+    with pytest.raises(ValueError):
+        plays.top('songs', windows=0)
+
+
+def play(song, artist, ts):
+    return {'page': 'NextSong', 'song': song, 'artist': artist, 'ts': ts}
+
+
+def test_late_play_counts_until_its_window_is_evicted():
+    plays = top_plays.TopPlays(window_seconds=300, windows=2)
+    plays.add_event(play('Song A', 'Artist A', NOV))
+    # Five minutes earlier, while a window is still free.
+    plays.add_event(play('Song B', 'Artist B', NOV - 300000))
+
+    assert len(plays.sketches) == 2
+    assert sorted(plays.top_songs(5, windows=2)) == [
+        ('Song A', 'Artist A', 1), ('Song B', 'Artist B', 1)
+    ]
+
+    # Every window is in use, so a play older than all of them is dropped.
+    plays.add_event(play('Song C', 'Artist C', NOV - 600000))
+    assert len(plays.sketches) == 2
+    assert ('Song C', 'Artist C', 1) not in plays.top_songs(5, windows=2)
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / 'top_plays.json')
+    plays = top_plays.TopPlays(
+        window_seconds=300, windows=3, capacity=5, width=64, depth=3
+    )
+    for i in range(20):
+        plays.add_event(play('Song %d' % (i % 4), 'Artist %d' % (i % 2),
+                             NOV + i * 60000))
+    plays.checkpoint(path)
+
+    restored = top_plays.TopPlays.restore(path)
+
+    assert (restored.window_seconds, restored.windows, restored.capacity,
+            restored.width, restored.depth) == (300, 3, 5, 64, 3)
+    assert list(restored.sketches) == list(plays.sketches)
+    for windows in [1, 3]:
+        assert restored.top_songs(10, windows) == plays.top_songs(10, windows)
+        assert restored.top_artists(10, windows) == (
+            plays.top_artists(10, windows)
+        )
+    for window, sketches in plays.sketches.items():
+        for kind, (cms, top_k) in sketches.items():
+            restored_cms, restored_top_k = restored.sketches[window][kind]
+            assert restored_top_k.counters == top_k.counters
+            for key in top_k.counters:
+                assert restored_cms.estimate(key) == cms.estimate(key)
+    assert not os.path.exists(path + '.tmp')
@@ -0,0 +1,273 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from collections import OrderedDict
+
+
+class CountMinSketch:
+    """Approximate counts for any number of keys in fixed memory.
+
+    Estimates never undercount. They overcount by at most 2N / width with
+    probability 1 - 0.5^depth, where N is the number of events added.
+    """
+
+    def __init__(self, width=2048, depth=4, table=None):
+        self.width = width
+        self.depth = depth
+        self.table = table or [[0] * width for _ in range(depth)]
+
+    def _buckets(self, key):
+        # Python's hash() is salted per process, which would break restoring
+        # from a checkpoint, so hash with a stable digest instead.
+        for row in range(self.depth):
+            digest = hashlib.blake2b(
+                ('%d:%s' % (row, key)).encode('utf-8'), digest_size=8
+            ).digest()
+            yield row, int.from_bytes(digest, 'big') % self.width
+
+    def add(self, key, count=1):
+        for row, bucket in self._buckets(key):
+            self.table[row][bucket] += count
+
+    def estimate(self, key):
+        return min(
+            self.table[row][bucket] for row, bucket in self._buckets(key)
+        )
+
+    def to_dict(self):
+        return {'width': self.width, 'depth': self.depth, 'table': self.table}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['width'], data['depth'], data['table'])
+
+
+class SpaceSaving:
+    """Track the most frequent keys using a fixed number of counters.
+
+    Any key seen more than N / capacity times is guaranteed to be tracked.
+    When the counters are full, a new key replaces the smallest counter and
+    inherits its count, which is recorded as the key's possible error.
+    """
+
+    def __init__(self, capacity=100, counters=None):
+        self.capacity = capacity
+        self.counters = counters or {}
+
+    def add(self, key, count=1):
+        if key in self.counters:
+            self.counters[key][0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[key] = [count, 0]
+        else:
+            smallest = min(self.counters, key=lambda k: self.counters[k][0])
+            floor = self.counters.pop(smallest)[0]
+            self.counters[key] = [floor + count, floor]
+
+    def top(self, n):
+        """Return the n largest (key, count, error) tuples."""
+        ranked = sorted(
+            self.counters.items(), key=lambda item: item[1][0], reverse=True
+        )
+        return [(key, count, error) for key, (count, error) in ranked[:n]]
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'counters': self.counters}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['capacity'], data['counters'])
+
+
+class TopPlays:
+    """Live top songs and artists over tumbling windows of song plays.
+
+    Each window keeps a count-min sketch and a space-saving summary for songs
+    and for artists. Only the most recent windows are kept, so memory stays
+    fixed no matter how long the stream runs.
+
+    Arguments:
+        window_seconds (int) - length of each window
+        windows (int) - number of most recent windows to keep
+        capacity (int) - space-saving counters per window
+        width (int) - count-min sketch width
+        depth (int) - count-min sketch depth
+    """
+
+    KINDS = ['songs', 'artists']
+
+    def __init__(self, window_seconds=300, windows=12, capacity=100,
+                 width=2048, depth=4):
+        self.window_seconds = window_seconds
+        self.windows = windows
+        self.capacity = capacity
+        self.width = width
+        self.depth = depth
+        self.sketches = OrderedDict()
+
+    def _new_window(self):
+        return {
+            kind: (
+                CountMinSketch(self.width, self.depth),
+                SpaceSaving(self.capacity)
+            )
+            for kind in self.KINDS
+        }
+
+    def add_event(self, event):
+        """Count a log-data event if it is a song play.
+
+        Arguments:
+            event (dict) - one parsed log-data JSON record
+        """
+        if event.get('page') != 'NextSong' or not event.get('song'):
+            return
+        seconds = event['ts'] // 1000
+        window = seconds - seconds % self.window_seconds
+        if window not in self.sketches:
+            # Drop plays arriving after their window has been evicted.
+            if (len(self.sketches) >= self.windows and
+                    window < next(iter(self.sketches))):
+                return
+            self.sketches[window] = self._new_window()
+            self.sketches = OrderedDict(sorted(self.sketches.items()))
+            while len(self.sketches) > self.windows:
+                self.sketches.popitem(last=False)
+        keys = {
+            # Plays without an artist still count, under an empty artist.
+            'songs': '%s\t%s' % (event.get('artist') or '', event['song']),
+            'artists': event.get('artist')
+        }
+        for kind, key in keys.items():
+            if key:
+                cms, top_k = self.sketches[window][kind]
+                cms.add(key)
+                top_k.add(key)
+
+    def top(self, kind, n=10, windows=1):
+        """Rank the most played songs or artists.
+
+        Candidates come from each window's space-saving summary, and their
+        counts from the count-min sketches summed across the windows.
+
+        Arguments:
+            kind (str) - "songs" or "artists"
+            n (int) - number of results
+            windows (int) - number of most recent windows to rank over
+
+        Returns:
+            ranked (list) - (key, estimated plays) tuples, most played first
+        """
+        if windows < 1:
+            raise ValueError('windows must be at least 1, got %r' % windows)
+        recent = list(self.sketches.values())[-windows:]
+        candidates = set()
+        for sketches in recent:
+            candidates.update(sketches[kind][1].counters)
+        counts = {
+            key: sum(sketches[kind][0].estimate(key) for sketches in recent)
+            for key in candidates
+        }
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:n]
+
+    def top_songs(self, n=10, windows=1):
+        """Return the n most played (song, artist, plays) tuples."""
+        return [
+            (key.split('\t', 1)[1], key.split('\t', 1)[0], plays)
+            for key, plays in self.top('songs', n, windows)
+        ]
+
+    def top_artists(self, n=10, windows=1):
+        """Return the n most played (artist, plays) tuples."""
+        return self.top('artists', n, windows)
+
+    def checkpoint(self, path):
+        """Write the sketches to disk, replacing any earlier checkpoint.
+
+        Arguments:
+            path (str) - checkpoint file path
+        """
+        data = {
+            'window_seconds': self.window_seconds,
+            'windows': self.windows,
+            'capacity': self.capacity,
+            'width': self.width,
+            'depth': self.depth,
+            'sketches': [
+                [window, {
+                    kind: [cms.to_dict(), top_k.to_dict()]
+                    for kind, (cms, top_k) in sketches.items()
+                }]
+                for window, sketches in self.sketches.items()
+            ]
+        }
+        # Write then rename so a crash never leaves a partial checkpoint.
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def restore(cls, path):
+        """Load sketches from a checkpoint written by checkpoint().
+
+        Arguments:
+            path (str) - checkpoint file path
+
+        Returns:
+            top_plays (TopPlays) - restored sketches
+        """
+        with open(path) as f:
+            data = json.load(f)
+        top_plays = cls(
+            data['window_seconds'], data['windows'], data['capacity'],
+            data['width'], data['depth']
+        )
+        for window, sketches in data['sketches']:
+            top_plays.sketches[window] = {
+                kind: (
+                    CountMinSketch.from_dict(cms),
+                    SpaceSaving.from_dict(top_k)
+                )
+                for kind, (cms, top_k) in sketches.items()
+            }
+        return top_plays
+
+
+def consume(lines, top_plays, checkpoint_path=None, checkpoint_every=10000):
+    """Feed a stream of log-data JSON lines into the sketches.
+
+    Arguments:
+        lines (iterable) - lines holding one JSON event each
+        top_plays (TopPlays) - sketches to update
+        checkpoint_path (str) - checkpoint file path, None to not checkpoint
+        checkpoint_every (int) - events between checkpoints
+    """
+    for i, line in enumerate(lines, 1):
+        if line.strip():
+            top_plays.add_event(json.loads(line))
+        if checkpoint_path and i % checkpoint_every == 0:
+            top_plays.checkpoint(checkpoint_path)
+    if checkpoint_path:
+        top_plays.checkpoint(checkpoint_path)
+
+
+if __name__ == '__main__':
+    # Parse command line args.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument('--top', default=10, type=int)
+    args = parser.parse_args()
+
+    # Pick up where the last run left off.
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        top_plays = TopPlays.restore(args.checkpoint)
+    else:
+        top_plays = TopPlays()
+    consume(sys.stdin, top_plays, args.checkpoint)
+    for song, artist, plays in top_plays.top_songs(args.top):
+        print('%d\t%s - %s' % (plays, artist, song))
+    for artist, plays in top_plays.top_artists(args.top):
+        print('%d\t%s' % (plays, artist))